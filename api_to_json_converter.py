@@ -2,39 +2,174 @@ import requests
 import pandas as pd
 import json
 import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+BASE_URL = "https://www.alphavantage.co/query"
+API_KEY = os.getenv("ALPHAVANTAGE_API_KEY")
+
+# Alpha Vantage free tier allows 5 requests per minute; premium keys raise this
+REQUESTS_PER_MINUTE = int(os.getenv("ALPHAVANTAGE_REQUESTS_PER_MINUTE", 5))
+
+# Only the per-minute throttle is worth waiting out; "Information" replies about an invalid key or
+# the daily quota are final
+THROTTLE_MARKERS = ("per minute", "call frequency")
+
+# Permissions a plain open() would give new files (mkstemp always creates them 0600)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+class RetryableError(Exception):
+    pass
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket: acquire() blocks until a token is available. Tokens refill
+    continuously at `rate` per `per` seconds, up to `capacity` saved for bursts.
+    '''
+
+    def __init__(self, rate, per=60.0, capacity=None):
+        self.fill_rate = rate / per
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+def earnings_path(symbol, data_dir):
+    return os.path.join(data_dir, f"{symbol}_earnings.json")
+
+def write_json_atomic(data, save_path):
+    #Write to a temp file in the same directory then rename, so readers never see a partial file
+    directory = os.path.dirname(save_path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file)
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, save_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def is_fresh(save_path, max_age_days):
+    if not os.path.exists(save_path):
+        return False
+    if max_age_days is None:
+        return True
+    return time.time() - os.path.getmtime(save_path) < max_age_days * 86400
+
+def request_earnings(session, symbol, api_key, base_url, timeout=30):
+    params = {
+        "function": "EARNINGS",
+        "symbol": symbol,
+        "apikey": api_key
+    }
+    try:
+        response = session.get(base_url, params=params, timeout=timeout)
+    except (requests.ConnectionError, requests.Timeout) as error:
+        raise RetryableError(str(error))
+
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"HTTP {response.status_code}")
+    response.raise_for_status()
+
+    payload = response.json()
+    if "quarterlyEarnings" in payload:
+        return payload["quarterlyEarnings"]
+    # Alpha Vantage answers throttled calls with HTTP 200 and a "Note"/"Information" message
+    message = payload.get("Note") or payload.get("Information")
+    if message and any(marker in message.lower() for marker in THROTTLE_MARKERS):
+        raise RetryableError(message)
+    raise ValueError(f"No earnings returned for {symbol}: {message or payload}")
+
+def fetch_with_retry(session, bucket, symbol, api_key, base_url, retries, backoff):
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            return request_earnings(session, symbol, api_key, base_url)
+        except RetryableError:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random())) # exponential backoff with jitter
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_earnings_bulk(symbols, data_dir="data/earnings", max_age_days=7, api_key=None, base_url=BASE_URL,
+                        requests_per_minute=REQUESTS_PER_MINUTE, max_workers=4, retries=4, backoff=2.0):
+    '''
+    Refreshes data/earnings for many symbols over one pooled session. Symbols whose cached JSON is
+    younger than max_age_days are skipped (None never refetches a cached file). Requests share a
+    token bucket so the whole crawl stays within the API quota. Returns {symbol: status}.
+    '''
+    os.makedirs(data_dir, exist_ok=True)
+    api_key = api_key or API_KEY
+    if api_key is None and not all(is_fresh(earnings_path(symbol, data_dir), max_age_days) for symbol in symbols):
+        raise ValueError("No Alpha Vantage API key: set ALPHAVANTAGE_API_KEY or pass api_key.")
+    bucket = TokenBucket(requests_per_minute, per=60.0)
+    session = make_session(max_workers)
+
+    def refresh(symbol):
+        save_path = earnings_path(symbol, data_dir)
+        if is_fresh(save_path, max_age_days):
+            return "cached"
+        try:
+            data = fetch_with_retry(session, bucket, symbol, api_key, base_url, retries, backoff)
+        except (RetryableError, ValueError, requests.RequestException) as error:
+            return f"failed: {error}"
+        write_json_atomic(data, save_path)
+        return "fetched"
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(symbols, executor.map(refresh, symbols)))
+    finally:
+        session.close()
 
 def fetch_earningcalls(symbol, data_dir):
     # Ensure the directory exists
     os.makedirs(data_dir, exist_ok=True)
-    
+
     # Set the path to save the file
-    save_path = os.path.join(data_dir, f"{symbol}_earnings.json")
+    save_path = earnings_path(symbol, data_dir)
 
     # Check if data is already saved locally
-    if os.path.exists(save_path):
-        with open(save_path, 'r') as file:
-            data = json.load(file)
-        return pd.DataFrame(data)
-    
-    # If not, fetch from API and save locally
-    params = {
-        "function": "EARNINGS",
-        "symbol": symbol,
-        "apikey": "OQ0K6DQV3DGAMH2S"
-    }
-    response = requests.get(BASE_URL, params=params)
-    data = response.json()["quarterlyEarnings"]
-    
-    with open(save_path, 'w') as file:
-        json.dump(data, file)
-    
+    if not os.path.exists(save_path):
+        # If not, fetch from API and save locally
+        status = fetch_earnings_bulk([symbol], data_dir, max_age_days=None)[symbol]
+        if status != "fetched":
+            raise ValueError(f"Could not fetch earnings for {symbol}: {status}")
+
+    with open(save_path, 'r') as file:
+        data = json.load(file)
     return pd.DataFrame(data)
 
 if __name__ == "__main__":
-    BASE_URL = "https://www.alphavantage.co/query"
-
     #symbols = ["AXP", "CAT", "CFG", "CRWD", "DD", "ETSY", "GOOGL","GS", "JNJ", "LMT", "MRK", "NEE", "NEM", "RHP", "SBUX", "SO", "SPG", "SQ", "TGT", "TM", "WYNN"]
     symbols = ["ABT"]
-    for symbol in symbols:
-        data_dir = "data/earnings"  # Directory where the data will be saved
-        print(fetch_earningcalls(symbol, data_dir))
+    data_dir = "data/earnings"  # Directory where the data will be saved
+    for symbol, status in fetch_earnings_bulk(symbols, data_dir).items():
+        print(symbol, status)
@@ -0,0 +1,173 @@
+'''
+Columnar bar store: data/columnar/{minute|daily}/{SYMBOL}/ holds one .npy file per column plus a
+sorted int64 timestamp.npy. Files are opened memory-mapped, so a date-range read only touches the
+pages of the rows it returns.
+'''
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from price_store import COLUMN_NAMES, FREQUENCY_DIRS
+
+COLUMNAR_DIR = os.path.join("data", "columnar")
+TIMESTAMP_FILE = "timestamp.npy"
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def bar_dir(symbol, frequency, root=COLUMNAR_DIR):
+    return os.path.join(root, FREQUENCY_DIRS.get(frequency, "daily"), symbol)
+
+
+def has_bars(symbol, frequency, root=COLUMNAR_DIR):
+    return os.path.exists(os.path.join(bar_dir(symbol, frequency, root), TIMESTAMP_FILE))
+
+
+def convert_symbol(symbol, frequency, data_dir="data", root=COLUMNAR_DIR):
+    #Convert one .h5 file to the columnar layout, swapping it in for any previous conversion by renames
+    df = pd.read_hdf(os.path.join(data_dir, FREQUENCY_DIRS.get(frequency, "daily"), f"{symbol}.h5"))
+    df.index = pd.to_datetime(df.index)
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+
+    target = bar_dir(symbol, frequency, root)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    np.save(os.path.join(staging, TIMESTAMP_FILE), df.index.values.astype("datetime64[ns]").view(np.int64))
+    for column in df.columns:
+        np.save(os.path.join(staging, f"{column}.npy"), df[column].to_numpy(dtype=np.float64))
+
+    # Move the old conversion aside first, so target always names a complete directory except for
+    # the instant between the two renames; readers that already opened its files keep them
+    retired = target + ".old"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(target):
+        os.replace(target, retired)
+    os.replace(staging, target)
+    shutil.rmtree(retired, ignore_errors=True)
+    return len(df)
+
+
+def convert_all(frequencies=("d", "m"), data_dir="data", root=COLUMNAR_DIR):
+    converted = {}
+    for frequency in frequencies:
+        source = os.path.join(data_dir, FREQUENCY_DIRS[frequency])
+        if not os.path.isdir(source):
+            continue
+        for name in sorted(os.listdir(source)):
+            if name.endswith(".h5"):
+                symbol = name[:-3]
+                converted[(symbol, frequency)] = convert_symbol(symbol, frequency, data_dir, root)
+    return converted
+
+
+def read_bar_arrays(symbol, frequency, start=None, end=None, root=COLUMNAR_DIR):
+    '''
+    Zero-copy read: returns (timestamps, {column: values}) as memory-mapped slices covering
+    start <= timestamp < end. Columns keep the names they had in the .h5 file.
+    '''
+    directory = bar_dir(symbol, frequency, root)
+    timestamps = np.load(os.path.join(directory, TIMESTAMP_FILE), mmap_mode="r")
+
+    lo = 0 if start is None else np.searchsorted(timestamps, pd.Timestamp(start).value, side="left")
+    hi = len(timestamps) if end is None else np.searchsorted(timestamps, pd.Timestamp(end).value, side="left")
+
+    columns = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".npy") and name != TIMESTAMP_FILE:
+            columns[name[:-4]] = np.load(os.path.join(directory, name), mmap_mode="r")[lo:hi]
+    return timestamps[lo:hi], columns
+
+
+def read_bars(symbol, frequency, start=None, end=None, root=COLUMNAR_DIR):
+    #Same slice as a DataFrame with the backtester's column names (copies only the selected rows)
+    timestamps, columns = read_bar_arrays(symbol, frequency, start, end, root)
+    df = pd.DataFrame({name: np.asarray(values) for name, values in columns.items()},
+                      index=pd.DatetimeIndex(np.asarray(timestamps).view("datetime64[ns]")))
+    return df.rename(columns=COLUMN_NAMES)
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024 # ru_maxrss is KB on Linux, bytes on macOS
+
+
+def _bench_child(mode, symbol, frequency, start, end, data_dir, root):
+    #Runs in a fresh interpreter so peak RSS only reflects one load path
+    baseline = _peak_rss_bytes()
+    started = time.perf_counter()
+    if mode == "hdf":
+        df = pd.read_hdf(os.path.join(data_dir, FREQUENCY_DIRS.get(frequency, "daily"), f"{symbol}.h5"))
+        df.rename(columns=COLUMN_NAMES, inplace=True)
+        df.index = pd.to_datetime(df.index)
+        df = df[(df.index >= start) & (df.index < end)]
+    else:
+        df = read_bars(symbol, frequency, start, end, root)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({"mode": mode, "rows": len(df), "seconds": elapsed, "peak_rss_delta": _peak_rss_bytes() - baseline}))
+
+
+def benchmark(symbol, frequency, start, end, repeats=3, data_dir="data", root=COLUMNAR_DIR):
+    '''
+    Compares the read_hdf path against the columnar reader for one date range. Each run happens in
+    its own subprocess; returns the best time and the peak RSS growth of each path.
+    '''
+    results = {}
+    for mode in ("hdf", "columnar"):
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, "-c",
+                 "import sys, bar_store; bar_store._bench_child(*sys.argv[1:])",
+                 mode, symbol, frequency, str(start), str(end), data_dir, root],
+                capture_output=True, text=True, check=True,
+                env={**os.environ, "PYTHONPATH": os.pathsep.join([MODULE_DIR, os.environ.get("PYTHONPATH", "")])},
+            )
+            runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        results[mode] = {
+            "rows": runs[0]["rows"],
+            "seconds": min(run["seconds"] for run in runs),
+            "peak_rss_delta": max(run["peak_rss_delta"] for run in runs),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert .h5 price files to the columnar store or benchmark it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert")
+    convert.add_argument("symbols", nargs="*", help="symbols to convert (default: every .h5 file)")
+    convert.add_argument("--frequency", choices=["d", "m"], action="append")
+
+    bench = commands.add_parser("bench")
+    bench.add_argument("symbol")
+    bench.add_argument("--frequency", choices=["d", "m"], default="m")
+    bench.add_argument("--start", default="2020-01-30")
+    bench.add_argument("--end", default=None, help="exclusive end (default: one day after start)")
+    bench.add_argument("--repeats", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        frequencies = args.frequency or ["d", "m"]
+        if args.symbols:
+            for frequency in frequencies:
+                for symbol in args.symbols:
+                    print(symbol, frequency, convert_symbol(symbol, frequency), "rows")
+        else:
+            for (symbol, frequency), rows in convert_all(frequencies).items():
+                print(symbol, frequency, rows, "rows")
+    else:
+        end = args.end or pd.Timestamp(args.start) + pd.Timedelta(days=1)
+        for mode, result in benchmark(args.symbol, args.frequency, args.start, end, args.repeats).items():
+            print(f"{mode:>9}: {result['rows']} rows in {result['seconds'] * 1000:.2f} ms, peak RSS +{result['peak_rss_delta'] / 1024 ** 2:.1f} MiB")
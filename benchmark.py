@@ -0,0 +1,201 @@
+'''
+Benchmark suite for the backtest pipeline on synthetic data, so it runs without the proprietary price
+files. A data tree laid out like data/ (daily or minute .h5 bars, Alpha Vantage style earnings JSON,
+SnP.csv) is generated once into a scratch directory, then every case (frequency, universe size,
+longest holding period) runs in its own interpreter inside that tree with instrumentation enabled:
+
+    load              price_store.load_prices
+    event_matching    prepare_earnings + resolving every event's trade rows
+    trade_generation  strategy sizing and trading-log assembly
+    aggregation       per-date PnL reduction
+    metrics           stream_metrics
+    beta              batch_betas
+
+Each case reports stage seconds, throughput (symbols, events and trades per second) and peak RSS.
+
+    python benchmark.py --sizes 10 50 --frequencies d m --horizons 5 31
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from bar_store import MODULE_DIR, _peak_rss_bytes
+from price_store import FREQUENCY_DIRS
+
+STRATEGIES = ['L_s_strategy', 'L_if_strategy', 'L_strategy', 'S_if_strategy', 'S_strategy']
+SESSION_START = pd.Timedelta(hours=9, minutes=30)
+
+
+def synthetic_days(start, end):
+    return pd.bdate_range(start, end)
+
+
+def synthetic_daily_bars(days, rng, price=100.0):
+    #Geometric random walk closes with opens jittered around them, in the raw .h5 column layout
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.02, len(days))))
+    open_ = close * (1 + rng.normal(0, 0.005, len(days)))
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close) * 1.01, "low": np.minimum(open_, close) * 0.99,
+                         "close": close, "volume": rng.integers(1_000, 1_000_000, len(days)).astype(np.float64)}, index=days)
+
+
+def synthetic_minute_bars(days, rng, bars_per_day=390, price=100.0):
+    index = (np.asarray(days, dtype="datetime64[ns]")[:, None] + np.asarray(SESSION_START.to_timedelta64())
+             + np.arange(bars_per_day)[None, :].astype("timedelta64[m]")).ravel()
+    close = price * np.exp(np.cumsum(rng.normal(0, 0.001, len(index))))
+    open_ = close * (1 + rng.normal(0, 0.0005, len(index)))
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close), "low": np.minimum(open_, close),
+                         "close": close, "volume": rng.integers(1, 10_000, len(index)).astype(np.float64)},
+                        index=pd.DatetimeIndex(index))
+
+
+def synthetic_earnings(days, rng, per_year=4):
+    #Quarterly reports on trading days with a random surprise, newest first like the API
+    count = max(1, int(len(days) / 252 * per_year))
+    reported = np.sort(rng.choice(len(days), size=min(count, len(days)), replace=False))[::-1]
+    records = []
+    for position in reported:
+        estimated = round(float(rng.normal(1, 0.3)), 2)
+        reported_eps = round(estimated + float(rng.normal(0, 0.2)), 2)
+        surprise = reported_eps - estimated
+        records.append({
+            "fiscalDateEnding": str((days[position] - pd.Timedelta(days=30)).date()),
+            "reportedDate": str(days[position].date()),
+            "reportedEPS": str(reported_eps) if rng.random() > 0.05 else "None",
+            "estimatedEPS": str(estimated),
+            "surprise": str(round(surprise, 2)),
+            "surprisePercentage": str(surprise / estimated * 100 if estimated else 0),
+            "reportTime": "post-market" if rng.random() > 0.5 else "pre-market",
+        })
+    return records
+
+
+def synthetic_index(start, end, rng):
+    months = pd.date_range(pd.Timestamp(start) - pd.offsets.MonthBegin(1), end, freq="MS")
+    opens = 2500 * np.exp(np.cumsum(rng.normal(0, 0.04, len(months))))
+    return pd.DataFrame({"Date": [month.strftime("%b-%y") for month in months][::-1],
+                         "Open": [f"{value:,.2f}" for value in opens][::-1]})
+
+
+def write_dataset(root, symbols, frequencies=("d", "m"), start="2019-01-01", end="2021-12-31", bars_per_day=390, seed=0):
+    #Writes root/data/{daily,minute,earnings}, root/data/SnP.csv and the earnings calendar
+    from earnings_calendar import ingest
+
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(root, "data")
+    days = synthetic_days(start, end)
+    for directory in [FREQUENCY_DIRS[frequency] for frequency in frequencies] + ["earnings"]:
+        os.makedirs(os.path.join(data_dir, directory), exist_ok=True)
+    for symbol in symbols:
+        price = float(rng.uniform(20, 500))
+        if "d" in frequencies:
+            synthetic_daily_bars(days, rng, price).to_hdf(os.path.join(data_dir, "daily", f"{symbol}.h5"), key="df")
+        if "m" in frequencies:
+            synthetic_minute_bars(days, rng, bars_per_day, price).to_hdf(os.path.join(data_dir, "minute", f"{symbol}.h5"), key="df")
+        with open(os.path.join(data_dir, "earnings", f"{symbol}_earnings.json"), 'w') as file:
+            json.dump(synthetic_earnings(days, rng), file)
+    synthetic_index(start, end, rng).to_csv(os.path.join(data_dir, "SnP.csv"), index=False)
+    ingest(os.path.join(data_dir, "earnings"), os.path.join(data_dir, "earnings_calendar.npz"))
+    return data_dir
+
+
+def case_holding_periods(frequency, horizon):
+    from earnings_tdata_json import holding_periods_for
+    return [holding_period for holding_period in holding_periods_for(frequency) if holding_period <= horizon]
+
+
+def _bench_child(frequency, size, horizon):
+    #Runs in a fresh interpreter inside the synthetic tree so peak RSS covers one case only
+    import instrumentation
+    from earnings_tdata_json import evaluate_portfolios, return_on_earning_multi
+    from price_store import load_prices
+
+    symbols = sorted(name[:-len(".h5")] for name in os.listdir(os.path.join("data", FREQUENCY_DIRS[frequency])))[:int(size)]
+    holding_periods = case_holding_periods(frequency, int(horizon))
+    baseline = _peak_rss_bytes()
+    instrumentation.enable()
+    started = time.perf_counter()
+
+    all_pnl = {(strat, holding_period): [] for strat in STRATEGIES for holding_period in holding_periods}
+    for symbol in symbols:
+        prices_df = load_prices(symbol, frequency)
+        for key, trading_log in return_on_earning_multi(symbol, prices_df, frequency, holding_periods, STRATEGIES).items():
+            all_pnl[key].append(trading_log)
+        del prices_df
+    for strat in STRATEGIES:
+        evaluate_portfolios({holding_period: all_pnl[(strat, holding_period)] for holding_period in holding_periods}, frequency, strat)
+
+    elapsed = time.perf_counter() - started
+    snapshot = instrumentation.snapshot()
+    print(json.dumps({"seconds": elapsed, "peak_rss_delta": _peak_rss_bytes() - baseline, **snapshot,
+                      "diagnostics": instrumentation.diagnostics.summary()}))
+
+
+def run_case(data_root, frequency, size, horizon):
+    output = subprocess.run(
+        [sys.executable, "-c", "import sys, benchmark; benchmark._bench_child(*sys.argv[1:])", frequency, str(size), str(horizon)],
+        capture_output=True, text=True, check=True, cwd=data_root,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([MODULE_DIR, os.environ.get("PYTHONPATH", "")]), "MPLBACKEND": "Agg"},
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def benchmark(sizes=(5, 20), frequencies=("d", "m"), horizons=(5, 31), start="2019-01-01", end="2021-12-31",
+              bars_per_day=390, repeats=1, seed=0, data_root=None):
+    '''
+    Runs every (frequency, size, horizon) case and returns one row per case: the best wall time over
+    `repeats`, seconds per stage, throughput and peak RSS growth.
+    '''
+    with tempfile.TemporaryDirectory(prefix="backtest-bench-") as scratch:
+        data_root = data_root or scratch
+        symbols = [f"SYN{number:04d}" for number in range(max(sizes))]
+        if not os.path.isdir(os.path.join(data_root, "data")):
+            write_dataset(data_root, symbols, frequencies, start, end, bars_per_day, seed)
+
+        rows = []
+        for frequency in frequencies:
+            for size in sizes:
+                for horizon in horizons:
+                    runs = [run_case(data_root, frequency, size, horizon) for _ in range(repeats)]
+                    best = min(runs, key=lambda run: run["seconds"])
+                    counters = best["counters"]
+                    row = {"frequency": frequency, "symbols": size, "horizon": horizon,
+                           "holding_periods": len(case_holding_periods(frequency, horizon)),
+                           "seconds": best["seconds"],
+                           "symbols_per_second": size / best["seconds"],
+                           "events_per_second": counters.get("events", 0) / best["seconds"],
+                           "trades_per_second": counters.get("trades", 0) / best["seconds"],
+                           "peak_rss_mib": max(run["peak_rss_delta"] for run in runs) / 1024 ** 2,
+                           "diagnostics": sum(best["diagnostics"].values())}
+                    for name, totals in best["stages"].items():
+                        row[f"{name}_seconds"] = totals["seconds"]
+                    rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the backtest pipeline on synthetic data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20], help="universe sizes (symbols)")
+    parser.add_argument("--frequencies", nargs="+", choices=["d", "m"], default=["d", "m"])
+    parser.add_argument("--horizons", type=int, nargs="+", default=[5, 31], help="longest holding period per case (days or minutes)")
+    parser.add_argument("--start", default="2019-01-01")
+    parser.add_argument("--end", default="2021-12-31")
+    parser.add_argument("--bars-per-day", type=int, default=390)
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-root", help="reuse (or keep) the synthetic data tree here instead of a temporary directory")
+    parser.add_argument("--output", help="also write the results as CSV")
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.frequencies, args.horizons, args.start, args.end, args.bars_per_day,
+                        args.repeats, args.seed, args.data_root)
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(results.to_string(index=False))
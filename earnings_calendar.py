@@ -0,0 +1,127 @@
+'''
+Consolidated earnings calendar: every data/earnings/{SYMBOL}_earnings.json parsed once into typed
+columns (datetime64 dates, float64 EPS, bool beat, categorical symbol/reportTime) and saved as one
+binary columnar .npz. Rows are grouped by symbol and keep each file's original order, with a
+symbol -> row range index, so a process loads it once and slices events without re-parsing.
+'''
+
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from results_store import file_manifest, manifest_arrays, manifest_matches, write_atomic
+
+EARNINGS_DIR = os.path.join("data", "earnings")
+CALENDAR_PATH = os.path.join("data", "earnings_calendar.npz")
+
+DATE_COLUMNS = ["reportedDate", "fiscalDateEnding"]
+NUMERIC_COLUMNS = ["reportedEPS", "estimatedEPS", "surprise", "surprisePercentage"]
+CATEGORICAL_COLUMNS = ["symbol", "reportTime"]
+
+_loaded = {}
+
+
+def parse_earnings(symbol, records):
+    #Type one symbol's raw Alpha Vantage records the same way return_on_earning used to
+    df = pd.DataFrame(records)
+    for column in DATE_COLUMNS:
+        df[column] = pd.to_datetime(df[column], errors="coerce") if column in df.columns else pd.NaT
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column].replace("None", np.nan), errors="coerce") if column in df.columns else np.nan
+    if "reportTime" not in df.columns:
+        df["reportTime"] = ""
+    df = df.dropna(subset=["reportedDate"])
+
+    df["beat"] = df["reportedEPS"] > df["estimatedEPS"]
+    df["symbol"] = symbol
+    return df[CATEGORICAL_COLUMNS[:1] + DATE_COLUMNS + NUMERIC_COLUMNS + ["beat", "reportTime"]]
+
+
+def ingest(earnings_dir=EARNINGS_DIR, path=CALENDAR_PATH):
+    #Build the calendar from every earnings JSON file and write it atomically
+    frames = []
+    paths = {os.path.basename(file_path)[:-len("_earnings.json")]: file_path for file_path in earnings_files(earnings_dir)}
+    manifest = file_manifest(paths.values()) # taken before reading, so a file changed mid-ingest is picked up next time
+    for symbol, file_path in sorted(paths.items()): # symbol order matches the categorical codes
+        with open(file_path, 'r') as file:
+            frames.append(parse_earnings(symbol, json.load(file)))
+    calendar = pd.concat(frames, ignore_index=True) if frames else parse_earnings("", [])
+
+    arrays = manifest_arrays(manifest)
+    for column in DATE_COLUMNS:
+        arrays[column] = calendar[column].to_numpy(dtype="datetime64[ns]")
+    for column in NUMERIC_COLUMNS:
+        arrays[column] = calendar[column].to_numpy(dtype=np.float64)
+    arrays["beat"] = calendar["beat"].to_numpy(dtype=bool)
+    for column in CATEGORICAL_COLUMNS:
+        categorical = pd.Categorical(calendar[column].fillna("").astype(str))
+        arrays[f"{column}_codes"] = categorical.codes.astype(np.int32)
+        arrays[f"{column}_categories"] = np.asarray(categorical.categories, dtype=str)
+
+    def write(temp_path):
+        with open(temp_path, 'wb') as file: # a file object, so savez keeps the unique temp name
+            np.savez(file, **arrays)
+    write_atomic(path, write)
+    return path
+
+
+def earnings_files(earnings_dir=EARNINGS_DIR):
+    return glob.glob(os.path.join(earnings_dir, "*_earnings.json"))
+
+
+def is_stale(earnings_dir=EARNINGS_DIR, path=CALENDAR_PATH):
+    #Stale unless the calendar was built from exactly the current files (names, mtimes and sizes)
+    return not os.path.exists(path) or not manifest_matches(path, file_manifest(earnings_files(earnings_dir)))
+
+
+class EarningsCalendar:
+    def __init__(self, arrays):
+        columns = {}
+        for column in DATE_COLUMNS + NUMERIC_COLUMNS + ["beat"]:
+            columns[column] = arrays[column]
+        for column in CATEGORICAL_COLUMNS:
+            columns[column] = pd.Categorical.from_codes(arrays[f"{column}_codes"], categories=arrays[f"{column}_categories"])
+        self.frame = pd.DataFrame(columns)
+
+        # Rows are grouped by symbol code, so each symbol is one contiguous row range
+        codes = arrays["symbol_codes"]
+        starts = np.searchsorted(codes, np.arange(len(arrays["symbol_categories"])), side="left")
+        ends = np.searchsorted(codes, np.arange(len(arrays["symbol_categories"])), side="right")
+        self.ranges = {symbol: (start, end) for symbol, start, end in zip(arrays["symbol_categories"], starts, ends)}
+
+    @property
+    def symbols(self):
+        return list(self.ranges)
+
+    def events(self, symbol, start=None, end=None):
+        #Typed events for one symbol, optionally limited to start <= reportedDate <= end
+        if symbol not in self.ranges:
+            raise FileNotFoundError(f"No earnings data file found for {symbol}.")
+        first, last = self.ranges[symbol]
+        events = self.frame.iloc[first:last]
+        if start is not None:
+            events = events[events["reportedDate"] >= pd.Timestamp(start)]
+        if end is not None:
+            events = events[events["reportedDate"] <= pd.Timestamp(end)]
+        return events.reset_index(drop=True)
+
+
+def load_calendar(earnings_dir=EARNINGS_DIR, path=CALENDAR_PATH):
+    #Loaded once per process; rebuilt first if an earnings file was added, removed or changed since it was built
+    if path not in _loaded:
+        if is_stale(earnings_dir, path):
+            ingest(earnings_dir, path)
+        with np.load(path, allow_pickle=False) as data:
+            _loaded[path] = EarningsCalendar({name: data[name] for name in data.files})
+    return _loaded[path]
+
+
+def symbol_events(symbol):
+    return load_calendar().events(symbol)
+
+
+if __name__ == "__main__":
+    print(f"Wrote {ingest()} with {len(load_calendar().frame)} events for {len(load_calendar().symbols)} symbols")
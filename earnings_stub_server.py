@@ -0,0 +1,115 @@
+'''
+Local stand-in for the Alpha Vantage EARNINGS endpoint, so api_to_json_converter can be exercised
+offline. Each symbol gets a script of replies served in order (the last one repeats): an HTTP error
+status, a JSON body such as a throttle "Note" or an "Information" message, or the earnings payload.
+
+    python earnings_stub_server.py     (runs the fetcher's offline checks against the stub)
+'''
+
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+THROTTLE_NOTE = {"Note": "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute and 500 calls per day."}
+INVALID_KEY = {"Information": "The **demo** API key is for demo purposes only. Please claim your free API key and pass it as the apikey parameter."}
+DAILY_QUOTA = {"Information": "Thank you for using Alpha Vantage! Our standard API rate limit is 25 requests per day."}
+
+
+def earnings_payload(symbol, quarters=4):
+    return {"symbol": symbol, "annualEarnings": [], "quarterlyEarnings": [
+        {"fiscalDateEnding": f"2023-{3 * (quarter + 1):02d}-30", "reportedDate": f"2023-{3 * (quarter + 1) + 1:02d}-20",
+         "reportedEPS": "1.10", "estimatedEPS": "1.00", "surprise": "0.10", "surprisePercentage": "10.0", "reportTime": "post-market"}
+        for quarter in range(quarters)]}
+
+
+class StubEarningsServer:
+    '''
+    Threaded HTTP server on 127.0.0.1 (a free port) answering ?function=EARNINGS&symbol=... from
+    scripts: {symbol: [reply, ...]} where a reply is an int status code or a dict sent as JSON.
+    Symbols without a script get the earnings payload. Counts requests per symbol.
+    '''
+
+    def __init__(self, scripts=None):
+        self.scripts = {symbol: list(replies) for symbol, replies in (scripts or {}).items()}
+        self.requests = {}
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                status, body = stub.reply(query.get("symbol", [""])[0])
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/query"
+
+    def reply(self, symbol):
+        with self.lock:
+            seen = self.requests[symbol] = self.requests.get(symbol, 0) + 1
+            script = self.scripts.get(symbol) or [earnings_payload(symbol)]
+            reply = script[min(seen, len(script)) - 1]
+        return (reply, {"error": reply}) if isinstance(reply, int) else (200, reply)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def check_fetcher():
+    #Retries, fail-fast cases, caching and file permissions of fetch_earnings_bulk, all offline
+    import api_to_json_converter as fetcher
+    from api_to_json_converter import _UMASK, earnings_path, fetch_earnings_bulk
+
+    scripts = {
+        "RETRY503": [503, earnings_payload("RETRY503")],
+        "THROTTLED": [THROTTLE_NOTE, earnings_payload("THROTTLED")],
+        "BADKEY": [INVALID_KEY],
+        "QUOTA": [DAILY_QUOTA],
+    }
+    expected = {"RETRY503": ("fetched", 2), "THROTTLED": ("fetched", 2), "BADKEY": ("failed", 1), "QUOTA": ("failed", 1), "OK": ("fetched", 1)}
+    with tempfile.TemporaryDirectory() as data_dir, StubEarningsServer(scripts) as stub:
+        options = {"data_dir": data_dir, "api_key": "stub", "base_url": stub.url, "requests_per_minute": 6000, "backoff": 0.0}
+        statuses = fetch_earnings_bulk(list(expected), **options)
+        for symbol, (status, requests) in expected.items():
+            assert statuses[symbol].startswith(status), (symbol, statuses[symbol])
+            assert stub.requests[symbol] == requests, (symbol, stub.requests[symbol])
+
+        mode = os.stat(earnings_path("OK", data_dir)).st_mode & 0o777
+        assert mode == 0o666 & ~_UMASK, oct(mode)
+
+        assert fetch_earnings_bulk(["OK"], **options) == {"OK": "cached"} and stub.requests["OK"] == 1
+        configured_key, fetcher.API_KEY = fetcher.API_KEY, None # ignore a key from the environment or .env
+        try:
+            fetch_earnings_bulk(["NOKEY"], **{**options, "api_key": None})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("fetching without an API key should fail before any request")
+        finally:
+            fetcher.API_KEY = configured_key
+        assert "NOKEY" not in stub.requests
+    return statuses
+
+
+if __name__ == "__main__":
+    for symbol, status in check_fetcher().items():
+        print(symbol, status)
+    print("Fetcher checks passed against the local stub server")
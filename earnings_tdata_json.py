@@ -1,10 +1,17 @@
 import pandas as pd
 import matplotlib.pyplot as plt
-import statsmodels.api as sm
 import numpy as np
 from dotenv import load_dotenv
 import os
 import json
+import fcntl
+from earnings_calendar import symbol_events
+from instrumentation import diagnostics, timed
+from event_engine import DayIndex, daily_trades, minute_trades, daily_trades_multi, minute_trades_multi
+from market_benchmark import aligned_returns, batch_betas, beta_from_returns, index_series, portfolio_beta
+from metrics import profit_per_contract, stack_daily_pnl, stream_metrics, trading_log_metrics
+from price_store import load_prices
+from trade_log import TradeLog
 
 load_dotenv()
 
@@ -19,13 +26,17 @@ def get_input_period():
     }
     return periods.get(choice, 'd')
 
-def get_next_trading_day(prices_df, reported_date):
-    max_date = prices_df.index.max()  # Get the maximum date in the prices DataFrame
-    while reported_date not in prices_df.index or reported_date.weekday() > 4:  # Skip weekends (Monday=0, Sunday=6)
-        reported_date += pd.Timedelta(days=1)
-        if reported_date > max_date:  # Stop if reported_date exceeds the available data range
-            raise ValueError(f"Exceeded available dates in prices data. Last date in data: {max_date}")
-    return reported_date
+def get_next_trading_day(prices_df, reported_date, n=0, day_index=None):
+    #First (or n-th further) trading day on/after reported_date among the symbol's own bars; accepts a whole array of dates.
+    #Pass a DayIndex built once per symbol when looking up dates in a loop.
+    if day_index is None:
+        day_index = DayIndex(prices_df.index)
+    dates = np.atleast_1d(np.asarray(reported_date, dtype="datetime64[ns]"))
+    positions = day_index.next_trading_day(dates) + n
+    if np.isnat(dates).any() or (positions >= len(day_index.trading_days)).any():  # Stop if reported_date exceeds the available data range
+        raise ValueError(f"Exceeded available dates in prices data. Last date in data: {prices_df.index.max()}")
+    next_days = day_index.days[day_index.trading_days[positions]]
+    return pd.Timestamp(next_days[0]) if np.ndim(reported_date) == 0 else pd.DatetimeIndex(next_days)
 
 def fetch_earningcalls(symbol):
     file_path = os.path.join("data/earnings", f"{symbol}_earnings.json")
@@ -38,77 +49,19 @@ def fetch_earningcalls(symbol):
 
 def fetch_spot_from_h5(symbol, period):
     #Fetch stock data from the .h5 file
-    if period == "m":
-        data_frequency = "minute"
-    else:
-        data_frequency = "daily"
-    df = pd.read_hdf(f"data/{data_frequency}/{symbol}.h5")
-    # Rename columns to match with API
-    df.rename(columns={
-        "open": "1. open",
-        "close": "4. close",
-        "high": "2. high",
-        "low": "3. low"
-    }, inplace=True)
-
-    df.index = pd.to_datetime(df.index)
-    df = df[df.index >= '2019-01-01']
+    return load_prices(symbol, period)
 
-    return df
+# Strategies (L_s_strategy, L_if_strategy, L_strategy, S_if_strategy, S_strategy, ...) are vectorized rules
+# registered in strategies.py; add new ones there with @register_strategy.
 
-def L_s_strategy(row, open, close, number_of_shares):
-    #long if beat, short if miss
-    if row["beat"]:
-        pnl = number_of_shares * (close - open)
-        position = "long"
-    else:
-        pnl = number_of_shares * (open - close)
-        position = "short"
-    return position, pnl
-
-def L_if_strategy(row, open, close, number_of_shares):
-    #long if beat, pass if miss
-    if row["beat"]:
-        pnl = number_of_shares * (close - open)
-        position = "long"
-    else:
-        pnl = 0
-        position = "pass"
-    return position, pnl
-
-def L_strategy(row, open, close, number_of_shares):
-    #Long every announcement
-    pnl = number_of_shares * (close - open)
-    position = "long"
-    return position, pnl
-
-def S_if_strategy(row, open, close, number_of_shares):
-    #Short if miss, pass if beat
-    if row["beat"]:
-        pnl = 0
-        position = "pass"
-    else:
-        pnl = number_of_shares * (open - close)
-        position = "short"
-    return position, pnl
-
-def S_strategy(row, open, close, number_of_shares): 
-    #Short every announcement
-    pnl = number_of_shares * (open - close)
-    position = "short"
-    return position, pnl
-   
-def return_on_earning(symbol, prices_df, frequency, holding_period, strat):
-    earnings_df = fetch_earningcalls(symbol)
-    
-    # Check if the DataFrame is empty or if the column does not exist
+@timed("event_matching")
+def prepare_earnings(symbol, prices_df, frequency):
+    #Events come pre-parsed (typed dates, EPS and beat flag) from the consolidated earnings calendar
+    earnings_df = symbol_events(symbol)
+
+    # Check if the DataFrame is empty
     if earnings_df.empty:
         raise ValueError(f"No data returned for {symbol}. Please check the data source.")
-    if "reportedDate" not in earnings_df.columns:
-        raise ValueError(f"'reportedDate' column is missing in the data for {symbol}.")
-
-    earnings_df["reportedDate"] = pd.to_datetime(earnings_df["reportedDate"], errors="coerce")
-    earnings_df.dropna(subset=["reportedDate"], inplace=True)
 
     # Adjust this line to account for minute-level data
     if frequency == 'm':
@@ -119,122 +72,31 @@ def return_on_earning(symbol, prices_df, frequency, holding_period, strat):
     else:
         earnings_df = earnings_df[earnings_df["reportedDate"].isin(prices_df.index)]
 
-    earnings_df["fiscalDateEnding"] = pd.to_datetime(earnings_df["fiscalDateEnding"], errors="coerce")
-    earnings_df["reportedEPS"] = pd.to_numeric(earnings_df["reportedEPS"].replace("None", pd.NA), errors='coerce')
-    earnings_df["estimatedEPS"] = pd.to_numeric(earnings_df["estimatedEPS"].replace("None", pd.NA), errors='coerce')
-    earnings_df["beat"] = earnings_df["reportedEPS"] > earnings_df["estimatedEPS"]
-    
+    return earnings_df
+
+def return_on_earning(symbol, prices_df, frequency, holding_period, strat):
+    earnings_df = prepare_earnings(symbol, prices_df, frequency)
+
     if frequency =='d':
         return process_earnings_d(earnings_df, prices_df, symbol, holding_period, strat)
     elif frequency == 'm':
         return process_earnings_m(earnings_df, prices_df, symbol, holding_period, strat)
-    
+
+def return_on_earning_multi(symbol, prices_df, frequency, holding_periods, strategies, day_index=None, allocation_percentage=None):
+    #Multi-horizon mode: parse and match events once, return {(strat, holding_period): trading log}
+    earnings_df = prepare_earnings(symbol, prices_df, frequency)
+
+    if frequency =='d':
+        return daily_trades_multi(earnings_df, prices_df, symbol, holding_periods, strategies, day_index, allocation_percentage)
+    elif frequency == 'm':
+        return minute_trades_multi(earnings_df, prices_df, symbol, holding_periods, strategies, day_index, allocation_percentage)
+
 def process_earnings_d(earnings_df, prices_df, symbol, holding_period, strat):
-    portfolio_value = 100000 #intial investment
-    trading_log = []
-
-    for index, row in earnings_df.iterrows():
-        prices_df.index = prices_df.index.normalize()
-        reported_date = row["reportedDate"].normalize()
-
-        if reported_date not in prices_df.index:
-            print(f"Warning: Reported date {reported_date} not found in price data. Skipping.")
-            continue
-        report_time = row["reportTime"]
-
-        # Adjust the starting date based on the report time
-        if report_time == "post-market":
-            start_date = reported_date + pd.Timedelta(days=1)
-        else:
-            start_date = reported_date
-
-        trading_dates = []
-        i = 0
-        while len(trading_dates) < holding_period:
-            try:
-                next_date = get_next_trading_day(prices_df, start_date + pd.Timedelta(days=i))
-                if next_date not in trading_dates:
-                    trading_dates.append(next_date)
-                i += 1
-            except ValueError:
-                print(f"Reached the end of the available data for {symbol} when looking for trading days.")
-                break
-
-        for trade_date in trading_dates:
-            if trade_date not in prices_df.index:
-                print(f"Warning: Trade date {trade_date} not found in price data. Skipping.")
-                continue
-            open_price = prices_df.loc[trade_date, "1. open"]
-            close_price = prices_df.loc[trade_date, "4. close"]
-            number_of_shares = calculate_position_size(portfolio_value, open_price, 5)
-
-            #set strategy here
-            position, pnl = globals()[strat](row, open_price, close_price, number_of_shares)
-            if position == "pass":
-                continue
-            
-            if trade_date == trading_dates[0]:
-                amount_invested = open_price * number_of_shares
-            else:
-                amount_invested = 0
-                
-            trading_dict = {
-                "dateExecuted": trade_date,
-                "Position": position,
-                "Stock": symbol,
-                "Open": f"${open_price:.2f}",
-                "Close": f"${close_price:.2f}",
-                "Amount Invested": amount_invested,
-                "Change (%)": ((close_price - open_price) / open_price) * 100,
-                "PnL": pnl
-            }
-            trading_log.append(trading_dict)
-
-            
-    return pd.DataFrame(trading_log)
+    #Vectorized: every event's holding days are resolved in one pass over the trading-day index
+    return daily_trades(earnings_df, prices_df, symbol, holding_period, strat)
 
 def process_earnings_m(earnings_df, prices_df, symbol, holding_period, strat):
-    portfolio_value = 100000 #intial investment
-    trading_log = []
-    for index, row in earnings_df.iterrows():
-        prices_df.index = prices_df.index.normalize()
-        reported_date = row["reportedDate"].normalize()
-        if reported_date not in prices_df.index:
-            print(f"Warning: Reported date {reported_date} not found in price data. Skipping.")
-            continue
-        report_time = row["reportTime"]
-
-        if report_time == "post-market":
-            reported_date = reported_date + pd.Timedelta(days=1)
-  
-        try:
-            trade_date = get_next_trading_day(prices_df, reported_date)
-        except ValueError:
-                print(f"Reached the end of the available data for {symbol} when looking for trading days.")
-                break
-
-        daily_rows = prices_df.loc[trade_date]
-        open_price = daily_rows.iloc[0]['1. open']
-        close_price = daily_rows.iloc[holding_period]['4. close'] #each row is a minute, take the first row, then count out the minutes
-        number_of_shares = calculate_position_size(portfolio_value, open_price, 15) #last value = %of portfolio value invested each trade
-
-        position, pnl = globals()[strat](row, open_price, close_price, number_of_shares)
-        if position == "pass":
-            continue
-        
-        trading_dict = {
-            "dateExecuted": trade_date,
-            "Position": position,
-            "Stock": symbol,
-            "Open": f"${open_price:.2f}",
-            "Close": f"${close_price:.2f}",
-            "Amount Invested": open_price * number_of_shares,
-            "Change (%)": ((close_price - open_price) / open_price) * 100,
-            "PnL": pnl
-        }
-        trading_log.append(trading_dict)
-    
-    return pd.DataFrame(trading_log)
+    return minute_trades(earnings_df, prices_df, symbol, holding_period, strat)
 
 def calculate_position_size(portfolio_value, stock_price, allocation_percentage):
     amount_to_invest = portfolio_value * (allocation_percentage / 100)  # Amount to invest
@@ -242,7 +104,7 @@ def calculate_position_size(portfolio_value, stock_price, allocation_percentage)
     return position_size
 
 def calculate_cumulative_pnl(df):
-    df = pd.DataFrame(df)
+    df = df.to_frame() if isinstance(df, TradeLog) else pd.DataFrame(df)
     df = df.sort_values(by='dateExecuted', ascending=True)
     df['Cumulative PnL'] = df['PnL'].cumsum()
     return df
@@ -273,10 +135,9 @@ def calculate_sharpe_ratio(df, type, period, trades):
 
      #anualized sharpe ratio
 
-    print("Average daily portfolio returns:", mean_daily_returns * 100, "%")
-    print("Daily standard deviation:", std_dev_daily_returns * 100, "%")
-    print("Daily Sharpe:", daily_sharpe)
-    print("Anual Sharpe:", sharpe)
+    diagnostics.record("sharpe_ratio", holding_period_type=type, holding_period=period,
+                       mean_daily_return=mean_daily_returns, std_daily_return=std_dev_daily_returns,
+                       daily_sharpe=daily_sharpe, annual_sharpe=sharpe)
     
     return yearly_data, sharpe, total_return
 
@@ -299,6 +160,8 @@ def calculate_profit_per_contract(df, pnl, type, period):
 
 def portfolio_return(df):
     initial_investment = 100000
+    if isinstance(df, TradeLog):
+        df = df.to_frame()
 
     df['Amount Invested'] = pd.to_numeric(df['Amount Invested'], errors='coerce')
     df['PnL'] = pd.to_numeric(df['PnL'], errors='coerce')
@@ -310,76 +173,23 @@ def portfolio_return(df):
     return grouped_df
 
 def market_beta(df):
-    # Convert date column to datetime
-    df['dateExecuted'] = pd.to_datetime(df['dateExecuted'])
-    
-    # Extract Year and Month
-    df['YearMonth'] = df['dateExecuted'].dt.to_period('M')
-
-    # Get min and max date
-    min_date = df['dateExecuted'].min()
-    max_date = df['dateExecuted'].max()
-
-    # Aggregate portfolio data to monthly frequency (last value of each month)
-    monthly_data = df.groupby('YearMonth').last()
-    monthly_data['Monthly Return'] = monthly_data['Portfolio Value'].pct_change()
-    monthly_data.reset_index(inplace=True)  # Reset index to merge later
-
-    # Load and clean S&P 500 data
-    sp = pd.read_csv("data/SnP.csv")
-    sp['Date'] = pd.to_datetime(sp['Date'], format='%b-%y', errors='coerce')
-    sp = sp.dropna(subset=['Date'])  # Drop invalid date rows
-
-    # Filter S&P 500 data to match the portfolio time range
-    sp = sp[(sp['Date'] >= min_date) & (sp['Date'] <= max_date)]
-
-    # Convert dates to Year-Month format to align with `monthly_data`
-    sp['YearMonth'] = sp['Date'].dt.to_period('M')
-
-    # Convert 'Open' prices to numeric
-    sp['Open'] = sp['Open'].replace(',', '', regex=True).astype(float)
-
-    # Aggregate S&P data to monthly frequency (last value of each month)
-    sp_monthly = sp.groupby('YearMonth').last()
-
-    # Merge portfolio and S&P data on Year-Month
-    merged_data = pd.merge(monthly_data, sp_monthly, on='YearMonth', suffixes=('_portfolio', '_sp'))
-
-    # Independent variable (portfolio monthly return)
-    X = sm.add_constant(merged_data['Monthly Return'])  # Add constant for OLS
-
-    # Dependent variable (S&P 500 monthly return)
-    merged_data['SP Return'] = merged_data['Open'].pct_change()
-    Y = merged_data['SP Return']
-
-    # Fit the model
-    model = sm.OLS(Y[1:], X[1:]).fit()  # Remove first NaN row due to pct_change()
-    beta = model.params['Monthly Return']
-
-    return beta
+    #Monthly portfolio returns vs the cached S&P 500 series, closed-form slope (see market_benchmark.market_beta_ols for diagnostics)
+    return portfolio_beta(df)
 
 def plot_pnl(df):
+    df['dateExecuted'] = pd.to_datetime(df['dateExecuted'])
     min_date = df['dateExecuted'].min()
     max_date = df['dateExecuted'].max()
-    df['dateExecuted'] = pd.to_datetime(df['dateExecuted'])
 
-    sp = pd.read_csv("data/SnP.csv")
-    sp['Date'] = pd.to_datetime(sp['Date'], format='%b-%y', errors='coerce')
-    sp = sp.dropna(subset=['Date'])  # Drop invalid date rows
-    sp = sp.sort_values(by='Date')
-    sp['Open'] = sp['Open'].replace(',', '', regex=True).astype(float)
-
-   
-    sp = sp[(sp['Date'] >= min_date) & (sp['Date'] <= max_date)]  # Filter S&P 500 data to match the portfolio time range
-    scale_fct = sp['Open'].iloc[0] / df['Portfolio Value'].iloc[0] # Help vizualize porfolio vs S&P by scaling starting point
-   
-    # print(sp)
+    sp_dates, sp_opens = index_series(min_date, max_date)  # Filter S&P 500 data to match the portfolio time range
+    scale_fct = sp_opens[0] / df['Portfolio Value'].iloc[0] # Help vizualize porfolio vs S&P by scaling starting point
+
     # Plotting both datasets
     plt.figure(figsize=(12, 6))  # Set the figure size
     plt.plot(df['dateExecuted'], df['Portfolio Value'], 
              marker='o', linestyle='-', markersize=4, label='Portfolio Value')  # Portfolio line plot with markers
 
-    plt.plot(sp['Date'], sp['Open'] / scale_fct, 
+    plt.plot(sp_dates, sp_opens / scale_fct, 
              marker='', linestyle='-', color='red', label='S&P 500 Open')  # S&P 500 line plot
 
     plt.title('Portfolio Value and S&P 500 Over Time')  # Title of the graph
@@ -391,9 +201,70 @@ def plot_pnl(df):
     plt.show()
 
 def append_to_csv(dataframe, filename):
-    file_exists = os.path.isfile(filename)
-    header = not file_exists or os.stat(filename).st_size == 0
-    dataframe.to_csv(filename, mode='a', header=header, index=False)
+    #Rows go out in one write under an exclusive lock, so concurrent writers can't interleave or double the header
+    with open(filename, 'a', newline='') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            header = os.fstat(file.fileno()).st_size == 0
+            file.write(dataframe.to_csv(header=header, index=False))
+            file.flush()
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+def holding_periods_for(holding_period_type):
+    #1-31 days, or 1-20 min then up to 55 min by 5 min
+    if holding_period_type == 'd':
+        return list(range(1, 32))
+    return list(range(1, 21)) + list(range(25, 60, 5))
+
+def analytics_row(strat, holding_period_type, holding_period, returns, max_drawdown, sharpe, profit, beta):
+    return {
+        "Strategy": strat,
+        "Holding Period": holding_period_type,
+        "Period Length": holding_period,
+        "Returns": float(returns),
+        "Maximum Drawdown": float(max_drawdown),
+        "Sharpe Ratio": float(sharpe),
+        "Profit Per Contract": float(profit),
+        "Portfolio Beta": float(beta)
+    }
+
+def evaluate_portfolio(all_pnl, holding_period_type, holding_period, strat):
+    #Single pass over the date-grouped PnL (see metrics.py) instead of the DataFrame pipeline above
+    results = trading_log_metrics(all_pnl, holding_period_type, holding_period)
+    beta = beta_from_returns(*aligned_returns(results["days"], results["portfolio_values"]))
+
+    analytics = analytics_row(strat, holding_period_type, holding_period, results["total_return"], results["max_drawdown"],
+                              results["sharpe"], results["profit_per_contract"], beta)
+    return analytics, results["yearly"]
+
+def evaluate_portfolios(all_pnl_by_period, holding_period_type, strat):
+    '''
+    Batch form of evaluate_portfolio: {holding_period: [trading logs]} for one strategy is reduced to a
+    horizons x days PnL matrix and scored in one pass. Returns the analytics rows in the given order.
+    '''
+    holding_periods = list(all_pnl_by_period)
+    trade_dates, trade_pnls = [], []
+    for holding_period in holding_periods:
+        logs = all_pnl_by_period[holding_period]
+        trade_dates.append(np.concatenate([log.dates for log in logs]))
+        trade_pnls.append(np.concatenate([log.pnl for log in logs]))
+
+    days, pnl_matrix = stack_daily_pnl(trade_dates, trade_pnls)
+    return score_pnl_matrix(days, pnl_matrix, [len(dates) for dates in trade_dates], holding_period_type, strat, holding_periods)
+
+def score_pnl_matrix(days, pnl_matrix, number_of_trades, holding_period_type, strat, holding_periods):
+    #Analytics rows for a horizons x days PnL matrix (NaN = no trades that day), one row per holding period
+    results = stream_metrics(days, pnl_matrix)
+    profit = profit_per_contract(results["total_pnl"], number_of_trades, holding_period_type, holding_periods)
+
+    values = results["portfolio_values"]
+    active = ~np.isnan(values)
+    betas = batch_betas([(days[active[row]], values[row, active[row]]) for row in range(len(holding_periods))])
+
+    return [analytics_row(strat, holding_period_type, holding_period, results["total_return"][row], results["max_drawdown"][row],
+                          results["sharpe"][row], profit[row], betas[row])
+            for row, holding_period in enumerate(holding_periods)]
 
 if __name__ == "__main__":
 
@@ -413,56 +284,12 @@ if __name__ == "__main__":
     strategies = ['L_s_strategy', 'L_if_strategy', 'L_strategy', 'S_if_strategy', 'S_strategy']
     # strategies = ['S_if_strategy']
     holding_types = ['d', 'm']
-    for holding_period_type in holding_types: #run for days and minutes
-        if holding_period_type == 'd':
-            length = 31
-        else:
-            length = 28
-        for strat in strategies:   #loop through each strategy
-            for i in range(length): #run each strategy for every interval 1-30 days/ 1-20 min then up to 1hr by 5 min
-                if holding_period_type == 'm' and i > 19: #start counting by 5 after 20 min
-                    holding_period = (i-20)*5 + 20
-                else:
-                    holding_period = i + 1
-            # holding_period = 1
-                all_pnl = []
-
-                for symbol in symbols:
-                    prices_df = fetch_spot_from_h5(symbol, holding_period_type) #read in price data
-                    trading_log = return_on_earning(symbol, prices_df, holding_period_type, holding_period, strat) #make trades based on strategy
-                    all_pnl.append(trading_log) #log every trade across all tickers
-
-                combined_pnl = pd.concat(all_pnl)
-                combined_pnl = calculate_cumulative_pnl(combined_pnl) #sort by date/track cumallative returns
-                portfolio_pnl = portfolio_return(combined_pnl) #group by day
-                portfolio_pnl.to_csv("Portfolio_Return.csv", index=False)
-
-                max_drawdown = calculate_max_drawdown(portfolio_pnl)
-                profit_per_contract = calculate_profit_per_contract(combined_pnl, portfolio_pnl, holding_period_type, holding_period)
-                yearly, sharpe, returns = calculate_sharpe_ratio(portfolio_pnl, holding_period_type, holding_period, combined_pnl)
-                beta = market_beta(portfolio_pnl)
-
-                yearly.to_csv("yearly.csv")
-
-                print(f"Maximum Drawdown: {max_drawdown * 100:.2f}%")
-                print(f"Profit Per Contract is: ${profit_per_contract:.2f}")
-                print(f"Sharpe Ratio: {sharpe:.2f}")
-                print(f"Return: {returns * 100:.5f}%")
-                print(f"Beta: {beta:.5f}")
-
-                combined_pnl.to_csv("Combined_Portfolio_PnL.csv", index=False)
-                
-                analytics_df = pd.DataFrame([{
-                    "Strategy": strat,
-                    "Holding Period": holding_period_type,
-                    "Period Length": holding_period,
-                    "Returns": returns,
-                    "Maximum Drawdown": max_drawdown,
-                    "Sharpe Ratio": sharpe,
-                    "Profit Per Contract": profit_per_contract,
-                    "Portfolio Beta": beta
-                }])
-
-                append_to_csv(analytics_df, "Performance_Metrics.csv") # Append results to CSV
-
-                # plot_pnl(portfolio_pnl)
\ No newline at end of file
+    workers = int(os.getenv("SWEEP_WORKERS", os.cpu_count())) #processes used for the sweep, 1 runs serially
+
+    incremental = os.getenv("SWEEP_INCREMENTAL", "1") == "1" #reuse cached trade logs/metrics for unchanged inputs
+
+    from sweep import run_sweep
+    from results_store import ResultsStore
+    store = ResultsStore() if incremental else None
+    results = run_sweep(symbols, strategies, holding_types, workers=workers, store=store) # Writes Performance_Metrics.csv
+    print(results.to_string(index=False))
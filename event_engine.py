@@ -0,0 +1,288 @@
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, diagnostics, stage
+from strategies import event_table, strategy_matrix
+from trade_log import TradeLog
+from trading_calendar import is_weekday, next_trading_table
+
+PORTFOLIO_VALUE = 100000 #intial investment used for position sizing
+
+# Percent of portfolio value invested per trade, by frequency
+ALLOCATION_PERCENTAGE = {
+    "d": 5,
+    "m": 15,
+}
+
+
+def event_arrays(earnings_df):
+    #Pull the per-event columns the engine needs out of a parsed earnings frame
+    reported = pd.DatetimeIndex(earnings_df["reportedDate"]).normalize().values
+    if "reportTime" in earnings_df.columns:
+        post_market = (earnings_df["reportTime"] == "post-market").to_numpy(dtype=bool)
+    else:
+        post_market = np.zeros(len(earnings_df), dtype=bool)
+    return reported, post_market
+
+
+def entry_dates(reported, post_market):
+    # Post-market reports are traded from the next day, everything else the same day
+    return reported + post_market.astype("timedelta64[D]")
+
+
+def day_ordinals(dates):
+    #Days since the epoch, the key used by the offset tables
+    return np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+
+
+class DayIndex:
+    '''
+    Per-symbol day -> (first_row, last_row) offset table over a sorted price index. Lookups go through
+    dense tables indexed by day ordinal, so finding a date (or the next trading day on/after it) is
+    constant time per date. Build once per symbol and pass it to every lookup.
+    '''
+
+    def __init__(self, index):
+        self.timestamps = pd.DatetimeIndex(index).values.astype("datetime64[ns]").view(np.int64)
+        normalized = pd.DatetimeIndex(index).normalize()
+        self.days, self.first_rows = np.unique(normalized.values, return_index=True)
+        self.last_rows = np.append(self.first_rows[1:], len(normalized)) - 1
+        ordinals = day_ordinals(self.days)
+        self.is_trading = is_weekday(ordinals) # Skip weekends
+        self.trading_days = np.flatnonzero(self.is_trading)
+
+        self.base = ordinals[0] if len(ordinals) else 0
+        span = (ordinals[-1] - self.base + 1) if len(ordinals) else 0
+
+        # day_slot[d] = position of day d in self.days, or -1 when there are no bars that day
+        self.day_slot = np.full(span, -1, dtype=np.int64)
+        self.day_slot[ordinals - self.base] = np.arange(len(ordinals))
+
+        # next_trading[d] = position in trading_days of the first trading day on/after day d
+        self.next_trading = next_trading_table(ordinals[self.is_trading], self.base, span)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.timestamps, self.days, self.first_rows, self.last_rows,
+                                              self.is_trading, self.trading_days, self.day_slot, self.next_trading))
+
+    def _offsets(self, dates):
+        return day_ordinals(dates) - self.base
+
+    def locate(self, dates):
+        #Position of each date in self.days, -1 when the date has no bars
+        offsets = self._offsets(dates)
+        inside = (offsets >= 0) & (offsets < len(self.day_slot))
+        return np.where(inside, self.day_slot[np.clip(offsets, 0, max(len(self.day_slot) - 1, 0))] if len(self.day_slot) else -1, -1)
+
+    def next_trading_day(self, dates):
+        #Position in trading_days of the first trading day on/after each date (len(trading_days) when past the data)
+        offsets = np.clip(self._offsets(dates), 0, len(self.day_slot))
+        return self.next_trading[offsets]
+
+    def exit_rows(self, day_slots, minutes):
+        '''
+        Exit bar for entering at the first bar of each day in day_slots and holding `minutes`: the last bar
+        at or before entry time + minutes, so missing bars don't shift the exit. -1 when the day ends first.
+        '''
+        entry_rows = self.first_rows[day_slots]
+        day_last = self.last_rows[day_slots]
+        minutes = np.asarray(minutes)
+        exit_times = self.timestamps[entry_rows] + minutes * 60_000_000_000
+        in_day = exit_times <= self.timestamps[day_last]
+
+        # Without gaps the exit is exactly `minutes` rows later; only mismatches need a search
+        guess = np.minimum(entry_rows + minutes, day_last)
+        exact = self.timestamps[guess] == exit_times
+        rows = np.where(exact, guess, np.searchsorted(self.timestamps, exit_times, side="right") - 1)
+        return np.where(in_day, rows, -1)
+
+
+def resolve_daily(prices_df, earnings_df, holding_period, day_index=None):
+    '''
+    Resolves the price rows traded by every event: one row per holding day, starting on the first
+    trading day on/after the entry date. Returns an events x holding_period matrix of row positions
+    (-1 where the data runs out) plus the matching trade dates.
+    '''
+    if day_index is None:
+        day_index = DayIndex(prices_df.index)
+    trading_days = day_index.trading_days
+    reported, post_market = event_arrays(earnings_df)
+
+    # Events whose report date has no bar are skipped, as in the original loop
+    listed = day_index.locate(reported) >= 0
+    start = day_index.next_trading_day(entry_dates(reported, post_market))
+
+    positions = start[:, None] + np.arange(holding_period)[None, :]
+    valid = (positions < len(trading_days)) & listed[:, None]
+    if len(trading_days) == 0:
+        return np.full(positions.shape, -1), np.empty(positions.shape, dtype="datetime64[ns]")
+
+    slots = trading_days[np.where(valid, positions, 0)]
+    return np.where(valid, day_index.first_rows[slots], -1), day_index.days[slots]
+
+
+def resolve_minute(prices_df, earnings_df, holding_periods, day_index=None):
+    '''
+    Resolves the entry row (first bar of the trade date) of every event and an events x holding_periods
+    matrix of exit rows (last bar at or before entry + holding_period minutes). Rows are -1 where the
+    trade can't be made.
+    '''
+    if day_index is None:
+        day_index = DayIndex(prices_df.index)
+    trading_days = day_index.trading_days
+    reported, post_market = event_arrays(earnings_df)
+    holding_periods = np.asarray(holding_periods)
+
+    listed = day_index.locate(reported) >= 0
+    start = day_index.next_trading_day(entry_dates(reported, post_market))
+    resolved = start < len(trading_days)
+
+    # The original loop stopped at the first event that ran past the data, so later events are dropped too
+    listed &= np.cumsum(listed & ~resolved) == 0
+    valid = listed & resolved
+    if len(trading_days) == 0:
+        return np.full(len(start), -1), np.full((len(start), len(holding_periods)), -1), np.empty(len(start), dtype="datetime64[ns]")
+
+    slots = trading_days[np.where(valid, start, 0)]
+    entry_rows = day_index.first_rows[slots]
+    exit_matrix = day_index.exit_rows(slots[:, None], holding_periods[None, :])
+    exit_matrix = np.where(valid[:, None], exit_matrix, -1)
+
+    return np.where(valid, entry_rows, -1), exit_matrix, day_index.days[slots]
+
+
+def position_sizes(open_prices, allocation_percentage, portfolio_value=PORTFOLIO_VALUE, weights=None):
+    amount_to_invest = portfolio_value * (allocation_percentage / 100)  # Amount to invest
+    if weights is not None:
+        amount_to_invest = amount_to_invest * weights
+    return np.floor_divide(amount_to_invest, open_prices)  # Number of shares/contracts to buy
+
+
+def strategy_sizes(strategies, earnings_df, open_prices, allocation_percentage):
+    '''
+    Signs and sizes every strategy from one strategies x events direction/weight matrix. Returns
+    {strat: (direction, shares)} with one direction per event and shares shaped like open_prices
+    (events first). Unweighted strategies share one share-count array; weighted ones are sized in a
+    single broadcast.
+    '''
+    directions, weights = strategy_matrix(strategies, event_table(earnings_df))
+    base_shares = position_sizes(open_prices, allocation_percentage)
+    weighted = ~np.all(weights == 1, axis=1)
+    if weighted.any():
+        weight_shape = (int(weighted.sum()),) + np.shape(weights)[1:] + (1,) * (np.ndim(open_prices) - 1)
+        weighted_shares = iter(position_sizes(np.asarray(open_prices)[None], allocation_percentage, weights=weights[weighted].reshape(weight_shape)))
+    return {strat: (directions[row], next(weighted_shares) if weighted[row] else base_shares)
+            for row, strat in enumerate(strategies)}
+
+
+def trade_pnl(open_prices, close_prices, signs, number_of_shares):
+    return np.where(signs > 0, number_of_shares * (close_prices - open_prices), number_of_shares * (open_prices - close_prices))
+
+
+def build_trading_log(symbol, dates, open_prices, close_prices, signs, number_of_shares, amount_invested):
+    #Assemble the columnar trading log from flat per-trade arrays, dropping passed trades
+    keep = signs != 0
+    count("trades", np.count_nonzero(keep))
+    dates, open_prices, close_prices = dates[keep], open_prices[keep], close_prices[keep]
+    signs, number_of_shares, amount_invested = signs[keep], number_of_shares[keep], amount_invested[keep]
+
+    return TradeLog.from_arrays(symbol, dates, open_prices, close_prices, signs, number_of_shares, amount_invested,
+                                trade_pnl(open_prices, close_prices, signs, number_of_shares))
+
+
+def record_unresolved(symbol, earnings_df, day_index, resolved):
+    #Diagnostics for the events the original loop warned about: report dates without bars, holding windows past the data
+    reported, _ = event_arrays(earnings_df)
+    listed = day_index.locate(reported) >= 0
+    if not listed.all():
+        diagnostics.record("reported_date_not_found", symbol, reported[~listed], count=np.count_nonzero(~listed))
+    truncated = listed & ~resolved
+    if truncated.any():
+        diagnostics.record("end_of_data", symbol, reported[truncated], count=np.count_nonzero(truncated),
+                           last_date=day_index.days[-1] if len(day_index.days) else None)
+
+
+def daily_trades_multi(earnings_df, prices_df, symbol, holding_periods, strategies, day_index=None, allocation_percentage=None):
+    '''
+    Builds the events x days price matrix once for the longest holding period and derives the
+    trading log of every (strategy, holding period) pair from it. Returns {(strat, period): log}.
+    '''
+    if day_index is None:
+        day_index = DayIndex(prices_df.index)
+    with stage("event_matching"):
+        row_matrix, date_matrix = resolve_daily(prices_df, earnings_df, max(holding_periods), day_index)
+    count("events", len(earnings_df))
+
+    valid = row_matrix >= 0
+    record_unresolved(symbol, earnings_df, day_index, valid.all(axis=1))
+    with stage("trade_generation"):
+        return _daily_logs(earnings_df, prices_df, symbol, holding_periods, strategies, row_matrix, date_matrix, valid, allocation_percentage)
+
+
+def _daily_logs(earnings_df, prices_df, symbol, holding_periods, strategies, row_matrix, date_matrix, valid, allocation_percentage):
+    rows = np.where(valid, row_matrix, 0)
+    open_matrix = prices_df["1. open"].to_numpy(dtype=np.float64)[rows]
+    close_matrix = prices_df["4. close"].to_numpy(dtype=np.float64)[rows]
+
+    sizes = {}
+    for strat, (direction, shares_matrix) in strategy_sizes(strategies, earnings_df, open_matrix, allocation_percentage or ALLOCATION_PERCENTAGE["d"]).items():
+        invested_matrix = np.zeros(row_matrix.shape)
+        invested_matrix[:, 0] = open_matrix[:, 0] * shares_matrix[:, 0] # only the first day counts as new money
+        sizes[strat] = (np.broadcast_to(direction[:, None], row_matrix.shape), shares_matrix, invested_matrix)
+
+    logs = {}
+    for holding_period in holding_periods:
+        in_period = valid[:, :holding_period]  # row-major, so trades stay grouped by event as before
+        columns = slice(0, holding_period)
+        trades = (
+            date_matrix[:, columns][in_period],
+            open_matrix[:, columns][in_period],
+            close_matrix[:, columns][in_period],
+        )
+        for strat in strategies:
+            signs, shares_matrix, invested_matrix = sizes[strat]
+            logs[(strat, holding_period)] = build_trading_log(symbol, *trades, signs[:, columns][in_period],
+                                                              shares_matrix[:, columns][in_period], invested_matrix[:, columns][in_period])
+    return logs
+
+
+def minute_trades_multi(earnings_df, prices_df, symbol, holding_periods, strategies, day_index=None, allocation_percentage=None):
+    #Same as daily_trades_multi: one entry resolution, one exit column per holding period
+    if day_index is None:
+        day_index = DayIndex(prices_df.index)
+    with stage("event_matching"):
+        entry_rows, exit_matrix, trade_dates = resolve_minute(prices_df, earnings_df, holding_periods, day_index)
+    count("events", len(earnings_df))
+
+    record_unresolved(symbol, earnings_df, day_index, entry_rows >= 0)
+    with stage("trade_generation"):
+        return _minute_logs(earnings_df, prices_df, symbol, holding_periods, strategies, entry_rows, exit_matrix, trade_dates, allocation_percentage)
+
+
+def _minute_logs(earnings_df, prices_df, symbol, holding_periods, strategies, entry_rows, exit_matrix, trade_dates, allocation_percentage):
+    opens = prices_df["1. open"].to_numpy(dtype=np.float64)
+    closes = prices_df["4. close"].to_numpy(dtype=np.float64)
+    open_prices = opens[np.maximum(entry_rows, 0)]
+    sizes = strategy_sizes(strategies, earnings_df, open_prices, allocation_percentage or ALLOCATION_PERCENTAGE["m"])
+
+    logs = {}
+    for column, holding_period in enumerate(holding_periods):
+        valid = exit_matrix[:, column] >= 0
+        close_prices = closes[exit_matrix[valid, column]]
+        for strat in strategies:
+            direction, number_of_shares = sizes[strat]
+            logs[(strat, holding_period)] = build_trading_log(
+                symbol, trade_dates[valid], open_prices[valid], close_prices,
+                direction[valid], number_of_shares[valid], open_prices[valid] * number_of_shares[valid])
+    return logs
+
+
+def daily_trades(earnings_df, prices_df, symbol, holding_period, strat):
+    #Open-to-close trade on each of the first holding_period trading days after the announcement
+    return daily_trades_multi(earnings_df, prices_df, symbol, [holding_period], [strat])[(strat, holding_period)]
+
+
+def minute_trades(earnings_df, prices_df, symbol, holding_period, strat):
+    #Enter at the first bar of the trade date, exit at the last bar up to holding_period minutes later
+    return minute_trades_multi(earnings_df, prices_df, symbol, [holding_period], [strat])[(strat, holding_period)]
@@ -0,0 +1,150 @@
+'''
+Optional instrumentation for the backtest pipeline, plus the diagnostics log.
+
+Stage timers and counters are off by default; stage() then hands back a shared no-op context, so the
+hooks left in the hot paths cost one function call. Turn them on around a run and read the totals:
+
+    import instrumentation
+    instrumentation.enable()
+    run_sweep(...)
+    instrumentation.snapshot()  # {"stages": {name: {"seconds", "calls"}}, "counters": {name: n}}
+
+Warnings the pipeline used to print (events whose report date has no bars, holding windows that run
+past the data, ...) are recorded in the diagnostics log as structured records instead: one record
+per symbol and kind, with the count and the affected dates. Records stay in memory and are also
+appended as JSON lines to DIAGNOSTICS_LOG when that environment variable is set, which is how
+records from sweep worker processes are kept.
+'''
+
+import contextlib
+import fcntl
+import functools
+import json
+import os
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+DIAGNOSTICS_PATH = os.getenv("DIAGNOSTICS_LOG")
+MAX_SAMPLES = 10 # dates kept per diagnostics record
+
+_NULL_STAGE = contextlib.nullcontext()
+_enabled = False
+_seconds = defaultdict(float)
+_calls = Counter()
+_counters = Counter()
+_depth = Counter()
+
+
+class _Stage:
+    #Only the outermost entry of a stage is timed, so a stage nested in itself isn't counted twice
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        _depth[self.name] += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _depth[self.name] -= 1
+        if _depth[self.name] == 0:
+            _seconds[self.name] += time.perf_counter() - self.started
+            _calls[self.name] += 1
+        return False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    _seconds.clear()
+    _calls.clear()
+    _counters.clear()
+
+
+def stage(name):
+    #Times the with-block under name (inclusive of nested stages) while instrumentation is enabled
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+
+def timed(name):
+    #Decorator form of stage() for functions that are a stage as a whole
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    if _enabled:
+        _counters[name] += int(amount)
+
+
+def snapshot():
+    return {
+        "stages": {name: {"seconds": _seconds[name], "calls": _calls[name]} for name in _seconds},
+        "counters": dict(_counters),
+    }
+
+
+class Diagnostics:
+    '''
+    Structured warning log. record() keeps a dict per warning: kind, symbol, count, a few sample
+    dates and any extra context; summary() counts them per kind.
+    '''
+
+    def __init__(self, path=DIAGNOSTICS_PATH):
+        self.path = path
+        self.records = []
+
+    def record(self, kind, symbol=None, dates=(), **context):
+        dates = np.asarray(dates)[:MAX_SAMPLES]
+        dates = list(np.datetime_as_string(dates, unit="D") if dates.dtype.kind == "M" else dates.astype(str))
+        entry = {"kind": kind, "symbol": symbol, "count": int(context.pop("count", len(dates)) or 1),
+                 "dates": dates, "pid": os.getpid(), **context}
+        self.records.append(entry)
+        if self.path:
+            self._append(entry)
+        return entry
+
+    def _append(self, entry):
+        #Same locking as append_to_csv, so concurrent workers never interleave lines
+        with open(self.path, 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.write(json.dumps(entry, default=str) + "\n")
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def summary(self):
+        totals = Counter()
+        for entry in self.records:
+            totals[entry["kind"]] += entry["count"]
+        return dict(totals)
+
+    def clear(self):
+        self.records.clear()
+
+
+diagnostics = Diagnostics()
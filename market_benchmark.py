@@ -0,0 +1,128 @@
+'''
+S&P 500 benchmark: data/SnP.csv is parsed once per process (re-read only if the file changes) into
+month-keyed arrays, and portfolio beta comes from a closed-form covariance/variance over the aligned
+monthly returns. statsmodels is only needed for the optional full-regression path.
+'''
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+SNP_PATH = os.path.join("data", "SnP.csv")
+
+
+@lru_cache(maxsize=4)
+def _load_index(path, mtime_ns):
+    sp = pd.read_csv(path)
+    sp['Date'] = pd.to_datetime(sp['Date'], format='%b-%y', errors='coerce')
+    sp = sp.dropna(subset=['Date'])  # Drop invalid date rows
+    dates = sp['Date'].to_numpy(dtype="datetime64[ns]")
+    opens = sp['Open'].replace(',', '', regex=True).astype(float).to_numpy()
+    dates.setflags(write=False)
+    opens.setflags(write=False)
+    return dates, opens
+
+
+def load_index(path=SNP_PATH):
+    #Rows in file order as (dates, opens); cached until the file's mtime changes
+    return _load_index(path, os.stat(path).st_mtime_ns)
+
+
+def month_keys(dates):
+    return np.asarray(dates, dtype="datetime64[ns]").astype("datetime64[M]").astype(np.int64)
+
+
+def last_per_month(dates, values):
+    #Last value of each month (in row order), returned sorted by month like groupby('YearMonth').last()
+    keys = month_keys(dates)
+    months, reversed_first = np.unique(keys[::-1], return_index=True)
+    return months, np.asarray(values)[len(keys) - 1 - reversed_first]
+
+
+def pct_change(values):
+    values = np.asarray(values, dtype=np.float64)
+    changes = np.full(len(values), np.nan)
+    changes[1:] = values[1:] / values[:-1] - 1
+    return changes
+
+
+def aligned_returns(dates, portfolio_values, path=SNP_PATH):
+    '''
+    Monthly portfolio and S&P returns aligned the way market_beta always did: portfolio returns are
+    month-over-month on the portfolio's own months, S&P returns are taken over the matched months only,
+    and the first matched month is dropped.
+    '''
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    months, month_values = last_per_month(dates, portfolio_values)
+    portfolio_returns = pct_change(month_values)
+
+    sp_dates, sp_opens = load_index(path)
+    in_range = (sp_dates >= dates.min()) & (sp_dates <= dates.max()) # Filter S&P 500 data to match the portfolio time range
+    sp_months, sp_month_opens = last_per_month(sp_dates[in_range], sp_opens[in_range])
+
+    _, portfolio_rows, sp_rows = np.intersect1d(months, sp_months, return_indices=True)
+    return portfolio_returns[portfolio_rows][1:], pct_change(sp_month_opens[sp_rows])[1:]
+
+
+def beta_from_returns(portfolio_returns, sp_returns):
+    #Slope of S&P returns on portfolio returns (the regression market_beta has always reported)
+    x = np.asarray(portfolio_returns, dtype=np.float64)
+    y = np.asarray(sp_returns, dtype=np.float64)
+    x_centered = x - x.mean()
+    return np.dot(x_centered, y - y.mean()) / np.dot(x_centered, x_centered)
+
+
+@timed("beta")
+def portfolio_beta(portfolio_pnl, path=SNP_PATH):
+    dates = pd.to_datetime(portfolio_pnl['dateExecuted']).to_numpy(dtype="datetime64[ns]")
+    return beta_from_returns(*aligned_returns(dates, portfolio_pnl['Portfolio Value'].to_numpy(), path))
+
+
+@timed("beta")
+def batch_betas(portfolios, path=SNP_PATH):
+    '''
+    Betas for many portfolios at once. Each portfolio is a portfolio_return frame or a (dates, values)
+    pair; returns are padded into one NaN-filled months x portfolios matrix and reduced column-wise.
+    '''
+    series = []
+    for portfolio in portfolios:
+        if isinstance(portfolio, pd.DataFrame):
+            portfolio = (pd.to_datetime(portfolio['dateExecuted']).to_numpy(dtype="datetime64[ns]"), portfolio['Portfolio Value'].to_numpy())
+        series.append(aligned_returns(portfolio[0], portfolio[1], path))
+    if not series:
+        return np.empty(0)
+
+    length = max(len(x) for x, _ in series)
+    x = np.full((length, len(series)), np.nan)
+    y = np.full((length, len(series)), np.nan)
+    for column, (portfolio_returns, sp_returns) in enumerate(series):
+        x[:len(portfolio_returns), column] = portfolio_returns
+        y[:len(sp_returns), column] = sp_returns
+
+    counts = np.array([len(portfolio_returns) for portfolio_returns, _ in series], dtype=np.float64)
+    present = np.arange(length)[:, None] < counts[None, :]
+    x_centered = np.where(present, x - np.where(present, x, 0).sum(axis=0) / counts, 0)
+    y_centered = np.where(present, y - np.where(present, y, 0).sum(axis=0) / counts, 0)
+    return (x_centered * y_centered).sum(axis=0) / (x_centered * x_centered).sum(axis=0)
+
+
+def market_beta_ols(portfolio_pnl, path=SNP_PATH):
+    #Full statsmodels OLS for diagnostics (standard errors, R^2, ...); statsmodels is optional
+    import statsmodels.api as sm
+    dates = pd.to_datetime(portfolio_pnl['dateExecuted']).to_numpy(dtype="datetime64[ns]")
+    portfolio_returns, sp_returns = aligned_returns(dates, portfolio_pnl['Portfolio Value'].to_numpy(), path)
+    X = sm.add_constant(pd.Series(portfolio_returns, name='Monthly Return'))
+    return sm.OLS(pd.Series(sp_returns, name='SP Return'), X).fit()
+
+
+def index_series(start, end, path=SNP_PATH):
+    #S&P 500 opens between start and end, sorted by date, for plotting
+    dates, opens = load_index(path)
+    order = np.argsort(dates, kind="stable")
+    dates, opens = dates[order], opens[order]
+    in_range = (dates >= np.datetime64(pd.Timestamp(start), "ns")) & (dates <= np.datetime64(pd.Timestamp(end), "ns"))
+    return dates[in_range], opens[in_range]
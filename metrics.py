@@ -0,0 +1,135 @@
+'''
+Single-pass metrics engine. Trades are reduced to one PnL per execution date, then a single walk over
+the dates keeps running accumulators for every portfolio at once: cumulative PnL, a running peak for
+drawdown, Welford mean/variance of daily returns and the last portfolio value of each year. Results match
+calculate_cumulative_pnl / portfolio_return / calculate_max_drawdown / calculate_sharpe_ratio /
+calculate_profit_per_contract without building intermediate DataFrames.
+'''
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+
+INITIAL_INVESTMENT = 100000
+TRADING_DAYS = 252
+
+
+@timed("aggregation")
+def daily_pnl(dates, pnl):
+    #Sum PnL per execution date; returns the sorted dates and their totals
+    dates = np.asarray(dates, dtype="datetime64[ns]")
+    days, day_of_trade = np.unique(dates, return_inverse=True)
+    return days, np.bincount(day_of_trade, weights=np.asarray(pnl, dtype=np.float64), minlength=len(days))
+
+
+@timed("aggregation")
+def stack_daily_pnl(trade_dates, trade_pnls):
+    '''
+    Batch input for stream_metrics: one (dates, pnl) pair per portfolio becomes a portfolios x days
+    matrix over the union of dates, NaN where a portfolio traded nothing that day.
+    '''
+    days = np.unique(np.concatenate([np.asarray(dates, dtype="datetime64[ns]") for dates in trade_dates])) if trade_dates else np.empty(0, dtype="datetime64[ns]")
+    matrix = np.full((len(trade_dates), len(days)), np.nan)
+    for row, (dates, pnl) in enumerate(zip(trade_dates, trade_pnls)):
+        portfolio_days, totals = daily_pnl(dates, pnl)
+        matrix[row, np.searchsorted(days, portfolio_days)] = totals
+    return days, matrix
+
+
+@timed("metrics")
+def stream_metrics(days, pnl_matrix, initial_investment=INITIAL_INVESTMENT):
+    '''
+    One pass over the sorted days for a portfolios x days PnL matrix (NaN = no trades that day).
+    Returns a dict of per-portfolio arrays plus the portfolio value matrix (NaN where inactive) and
+    the year-end portfolio values used for the yearly table.
+    '''
+    pnl_matrix = np.atleast_2d(np.asarray(pnl_matrix, dtype=np.float64))
+    portfolios, n_days = pnl_matrix.shape
+    years = pd.DatetimeIndex(days).year.values if n_days else np.empty(0, dtype=np.int64)
+    year_labels, year_of_day = np.unique(years, return_inverse=True)
+
+    cumulative = np.zeros(portfolios)
+    previous_value = np.full(portfolios, np.nan)
+    peak = np.full(portfolios, -np.inf)
+    max_drawdown = np.full(portfolios, np.nan)
+    count = np.zeros(portfolios)
+    mean = np.zeros(portfolios)
+    m2 = np.zeros(portfolios)
+    year_end_values = np.full((portfolios, len(year_labels)), np.nan)
+    values = np.full((portfolios, n_days), np.nan)
+
+    for day in range(n_days):
+        day_pnl = pnl_matrix[:, day]
+        active = ~np.isnan(day_pnl)
+        if not active.any():
+            continue
+        cumulative = np.where(active, cumulative + np.where(active, day_pnl, 0), cumulative)
+        value = initial_investment + cumulative
+        values[active, day] = value[active]
+
+        # Welford update on the daily return, only once a portfolio has a previous value
+        has_return = active & ~np.isnan(previous_value)
+        daily_return = value / previous_value - 1
+        count = np.where(has_return, count + 1, count)
+        delta = np.where(has_return, daily_return - mean, 0)
+        mean = mean + np.where(has_return, delta / np.maximum(count, 1), 0)
+        m2 = m2 + np.where(has_return, delta * (daily_return - mean), 0)
+        previous_value = np.where(active, value, previous_value)
+
+        peak = np.where(active, np.maximum(peak, value), peak)
+        drawdown = (value - peak) / peak
+        max_drawdown = np.where(active, np.fmin(max_drawdown, drawdown), max_drawdown)
+
+        year_end_values[active, year_of_day[day]] = value[active]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(m2 / (count - 1))
+        mean = np.where(count > 0, mean, np.nan)
+        sharpe = mean * np.sqrt(TRADING_DAYS) / std
+        final_value = previous_value
+        total_return = (final_value - initial_investment) / initial_investment
+
+    return {
+        "days": days,
+        "portfolio_values": values,
+        "total_pnl": cumulative,
+        "total_return": total_return,
+        "max_drawdown": max_drawdown,
+        "mean_daily_return": mean,
+        "std_daily_return": std,
+        "sharpe": sharpe,
+        "years": year_labels,
+        "year_end_values": year_end_values,
+    }
+
+
+def yearly_table(years, year_end_values, initial_investment=INITIAL_INVESTMENT):
+    #Same layout calculate_sharpe_ratio returned: a starting row for the year before, then each year's last value
+    present = ~np.isnan(year_end_values)
+    years, year_end_values = years[present], year_end_values[present]
+    yearly_data = pd.DataFrame({
+        'Year': np.concatenate([[years.min() - 1] if len(years) else [], years]).astype(int),
+        'Portfolio Value': np.concatenate([[initial_investment], year_end_values]) if len(years) else [],
+    })
+    yearly_data['Yearly Return'] = yearly_data['Portfolio Value'].pct_change()
+    return yearly_data
+
+
+def profit_per_contract(total_pnl, number_of_trades, holding_period_type, holding_period):
+    number_of_contracts = np.asarray(number_of_trades, dtype=np.float64)
+    if holding_period_type == 'd':
+        number_of_contracts = number_of_contracts / np.asarray(holding_period)
+    return np.asarray(total_pnl) / number_of_contracts
+
+
+def trading_log_metrics(trading_logs, holding_period_type, holding_period):
+    #Metrics for one portfolio made of per-symbol trading logs
+    dates = np.concatenate([log.dates for log in trading_logs])
+    pnl = np.concatenate([log.pnl for log in trading_logs])
+    days, day_pnl = daily_pnl(dates, pnl)
+    results = stream_metrics(days, day_pnl[None, :])
+    results = {name: value[0] if isinstance(value, np.ndarray) and name not in ("days", "years") else value for name, value in results.items()}
+    results["profit_per_contract"] = profit_per_contract(results["total_pnl"], len(dates), holding_period_type, holding_period)
+    results["yearly"] = yearly_table(results["years"], results["year_end_values"])
+    return results
@@ -0,0 +1,289 @@
+'''
+Out-of-core minute backtests. A minute trade only needs the bars of two days per event (the report
+date, to check it traded, and the entry day), so instead of loading a symbol's whole minute history
+each event's window is read on its own:
+
+    columnar store  data/columnar/minute/{SYMBOL}: searchsorted on the memory-mapped timestamps, so
+                    only the pages of the requested days are touched
+    HDF5 table      data/minute/{SYMBOL}.h5 written with format="table": a `where` query per window
+    HDF5 fixed      cannot be queried by range; the file is read once and sliced (convert it with
+                    `python minute_stream.py table` or `python bar_store.py convert` first)
+
+The kept days form a small price frame that goes through the normal minute engine, so the trades
+are the same as a full load. Each symbol's trading logs are reduced to per-date PnL sums right away
+and folded into a running accumulator, and symbols are consumed as a generator (optionally across
+a process pool), so memory is bounded by one symbol's event windows plus the per-date totals,
+whatever the universe size.
+
+    python minute_stream.py run AAPL MSFT ... [--workers N]
+'''
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bar_store import TIMESTAMP_FILE, bar_dir, has_bars
+from earnings_calendar import symbol_events
+from earnings_tdata_json import holding_periods_for, score_pnl_matrix
+from event_engine import event_arrays, minute_trades_multi
+from instrumentation import count, diagnostics, stage, timed
+from metrics import daily_pnl
+from price_store import COLUMN_NAMES, DEFAULT_START_DATE, FREQUENCY_DIRS
+from results_store import write_atomic
+from trading_calendar import is_weekday, load_calendar
+
+DAY_NS = 86_400_000_000_000
+SEARCH_DAYS = 7 # window searched for the entry trading day when the calendar has none; doubled until the data ends
+PRICE_COLUMNS = ["open", "close"]
+
+
+def timestamp_values(index):
+    return pd.DatetimeIndex(index).values.astype("datetime64[ns]").view(np.int64)
+
+
+class ArrayBars:
+    #Range reads over sorted int64 timestamps and column arrays (memory-mapped or in memory)
+    def __init__(self, timestamps, columns):
+        self.timestamps = timestamps
+        self.columns = columns
+        self.last_timestamp = int(timestamps[-1]) if len(timestamps) else None
+
+    def window(self, start, end):
+        lo, hi = np.searchsorted(self.timestamps, [start, end], side="left")
+        return np.asarray(self.timestamps[lo:hi]), {name: np.asarray(values[lo:hi]) for name, values in self.columns.items()}
+
+    def close(self):
+        pass
+
+
+class TableBars:
+    #`where` range queries against an HDF5 table-format file
+    def __init__(self, path):
+        self.store = pd.HDFStore(path, mode="r")
+        self.key = self.store.keys()[0]
+        nrows = self.store.get_storer(self.key).nrows
+        self.last_timestamp = int(timestamp_values(self.store.select(self.key, start=nrows - 1).index)[-1]) if nrows else None
+
+    def window(self, start, end):
+        frame = self.store.select(self.key, where=f"index >= '{pd.Timestamp(start)}' & index < '{pd.Timestamp(end)}'", columns=PRICE_COLUMNS)
+        return timestamp_values(frame.index), {name: frame[name].to_numpy(dtype=np.float64) for name in PRICE_COLUMNS}
+
+    def close(self):
+        self.store.close()
+
+
+def open_bars(symbol, frequency='m', data_dir="data"):
+    #Best available windowed reader for one symbol's bars
+    columnar_root = os.path.join(data_dir, "columnar")
+    if has_bars(symbol, frequency, columnar_root):
+        directory = bar_dir(symbol, frequency, columnar_root)
+        return ArrayBars(np.load(os.path.join(directory, TIMESTAMP_FILE), mmap_mode="r"),
+                         {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in PRICE_COLUMNS})
+
+    path = os.path.join(data_dir, FREQUENCY_DIRS[frequency], f"{symbol}.h5")
+    with pd.HDFStore(path, mode="r") as store:
+        is_table = store.get_storer(store.keys()[0]).is_table
+    if is_table:
+        return TableBars(path)
+
+    diagnostics.record("unindexed_minute_file", symbol, path=path)
+    frame = pd.read_hdf(path)
+    frame.index = pd.to_datetime(frame.index)
+    if not frame.index.is_monotonic_increasing:
+        frame = frame.sort_index(kind="stable")
+    return ArrayBars(timestamp_values(frame.index), {name: frame[name].to_numpy(dtype=np.float64) for name in PRICE_COLUMNS})
+
+
+def event_window(bars, reported, entry, start, expected_entry=None):
+    '''
+    Bars to keep for one event, {day ordinal: (timestamps, columns)}: the report date and the first
+    trading day on/after the entry date. Empty when the report date has no bars (the event is not
+    traded); only the report date when the data ends before a trading day is found. expected_entry
+    (the shared calendar's trading day) sizes the first read; the window grows if the symbol has no
+    bars that day.
+    '''
+    if reported < start:
+        return {}
+    span = SEARCH_DAYS
+    window_end = expected_entry + DAY_NS if expected_entry is not None else entry + span * DAY_NS
+    while True:
+        timestamps, columns = bars.window(reported, window_end)
+        days = timestamps // DAY_NS
+        trading = (days >= entry // DAY_NS) & is_weekday(days)
+        if trading.any() or bars.last_timestamp is None or bars.last_timestamp < window_end:
+            break
+        span = max(span, (window_end - entry) // DAY_NS) * 2
+        window_end = entry + span * DAY_NS
+
+    kept = {}
+    for day in [reported // DAY_NS] + ([days[np.argmax(trading)]] if trading.any() else []):
+        rows = days == day
+        if not rows.any():
+            break
+        kept[day] = (timestamps[rows], {name: values[rows] for name, values in columns.items()})
+    return kept
+
+
+@timed("load")
+def event_frame(symbol, earnings_df, start_date=DEFAULT_START_DATE, data_dir="data"):
+    '''
+    The minute bars of every event's report date and entry day as one price frame, plus the events
+    whose report date has bars (what prepare_earnings keeps after a full load).
+    '''
+    reported, post_market = event_arrays(earnings_df)
+    reported = reported.astype("datetime64[ns]").view(np.int64)
+    entry = reported + post_market.astype(np.int64) * DAY_NS
+    start = pd.Timestamp(start_date).value
+    expected_entry = load_calendar(data_dir).nth_trading_day(entry.view("datetime64[ns]")).view(np.int64)
+
+    bars = open_bars(symbol, 'm', data_dir)
+    try:
+        listed = np.zeros(len(reported), dtype=bool)
+        kept = {}
+        for event in range(len(reported)):
+            expected = None if expected_entry[event] == np.iinfo(np.int64).min else expected_entry[event] # NaT
+            event_days = event_window(bars, reported[event], entry[event], start, expected)
+            listed[event] = len(event_days) > 0
+            kept.update(event_days)
+    finally:
+        bars.close()
+
+    days = sorted(kept)
+    timestamps = np.concatenate([kept[day][0] for day in days]) if days else np.empty(0, dtype=np.int64)
+    frame = pd.DataFrame({COLUMN_NAMES[name]: np.concatenate([kept[day][1][name] for day in days]) if days else np.empty(0)
+                          for name in PRICE_COLUMNS},
+                         index=pd.DatetimeIndex(timestamps.view("datetime64[ns]")))
+    count("bars_read", len(frame))
+    return frame, earnings_df[listed]
+
+
+def reduce_logs(trading_logs):
+    #{key: trading log} -> {key: (days, pnl per day, trades per day)}
+    reduced = {}
+    for key, trading_log in trading_logs.items():
+        days, totals = daily_pnl(trading_log.dates, trading_log.pnl)
+        trades = np.bincount(np.searchsorted(days, trading_log.dates), minlength=len(days))
+        reduced[key] = (days, totals, trades)
+    return reduced
+
+
+def symbol_minute_pnl(symbol, holding_periods, strategies, allocation_percentage=None, data_dir="data"):
+    #Work unit: one symbol's windowed minute backtest, reduced to per-date totals per (strat, holding period)
+    earnings_df = symbol_events(symbol)
+    prices_df, earnings_df = event_frame(symbol, earnings_df, data_dir=data_dir)
+    if len(prices_df) == 0:
+        return {}
+    return reduce_logs(minute_trades_multi(earnings_df, prices_df, symbol, holding_periods, strategies,
+                                           allocation_percentage=allocation_percentage))
+
+
+class DailyAccumulator:
+    '''
+    Running per-date PnL and trade counts per key. Each add merges a symbol's totals into the
+    sorted dates seen so far, so the state is bounded by keys x distinct trading days.
+    '''
+
+    def __init__(self):
+        self.totals = {}
+
+    def add(self, reduced):
+        for key, (days, pnl, trades) in reduced.items():
+            if key not in self.totals:
+                self.totals[key] = (days, pnl.astype(np.float64), trades.astype(np.int64))
+                continue
+            known_days, known_pnl, known_trades = self.totals[key]
+            merged_days = np.union1d(known_days, days)
+            merged_pnl = np.zeros(len(merged_days))
+            merged_trades = np.zeros(len(merged_days), dtype=np.int64)
+            for source_days, source_pnl, source_trades in ((known_days, known_pnl, known_trades), (days, pnl, trades)):
+                positions = np.searchsorted(merged_days, source_days)
+                merged_pnl[positions] += source_pnl
+                merged_trades[positions] += source_trades
+            self.totals[key] = (merged_days, merged_pnl, merged_trades)
+
+    def matrix(self, keys):
+        #(days, keys x days PnL with NaN where nothing traded, trades per key)
+        present = [self.totals[key] for key in keys if key in self.totals]
+        days = np.unique(np.concatenate([entry[0] for entry in present])) if present else np.empty(0, dtype="datetime64[ns]")
+        pnl_matrix = np.full((len(keys), len(days)), np.nan)
+        trades = np.zeros(len(keys), dtype=np.int64)
+        for row, key in enumerate(keys):
+            if key in self.totals:
+                key_days, key_pnl, key_trades = self.totals[key]
+                pnl_matrix[row, np.searchsorted(days, key_days)] = key_pnl
+                trades[row] = key_trades.sum()
+        return days, pnl_matrix, trades
+
+
+def stream_symbols(symbols, holding_periods, strategies, allocation_percentage=None, workers=1):
+    #Generator of (symbol, reduced totals); results are small, so a pool never holds more than per-date sums
+    from sweep import _map
+    from concurrent.futures import ProcessPoolExecutor
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results = _map(executor, workers, symbol_minute_pnl, symbols, [holding_periods] * len(symbols),
+                       [strategies] * len(symbols), [allocation_percentage] * len(symbols))
+        yield from zip(symbols, results)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def stream_minute_metrics(symbols, strategies, holding_periods=None, allocation_percentage=None, workers=1):
+    '''
+    Performance_Metrics rows for a minute backtest of the whole universe, in the sweep's
+    (strategy, holding period) order, reading only the event windows of each symbol.
+    '''
+    holding_periods = list(holding_periods or holding_periods_for('m'))
+    load_calendar() # rebuilt here if stale, so workers only read it
+    accumulator = DailyAccumulator()
+    for _, reduced in stream_symbols(symbols, holding_periods, strategies, allocation_percentage, workers):
+        with stage("aggregation"):
+            accumulator.add(reduced)
+
+    rows = []
+    for strat in strategies:
+        days, pnl_matrix, trades = accumulator.matrix([(strat, holding_period) for holding_period in holding_periods])
+        rows.extend(score_pnl_matrix(days, pnl_matrix, trades, 'm', strat, holding_periods))
+    return rows
+
+
+def convert_to_table(symbol, frequency='m', data_dir="data"):
+    #Rewrite one .h5 file in queryable table format (same key and columns), replacing it atomically
+    path = os.path.join(data_dir, FREQUENCY_DIRS[frequency], f"{symbol}.h5")
+    with pd.HDFStore(path, mode="r") as store:
+        key = store.keys()[0]
+        frame = store.select(key)
+    frame.index = pd.to_datetime(frame.index)
+    write_atomic(path, lambda temp_path: frame.sort_index(kind="stable").to_hdf(temp_path, key=key, format="table"))
+    return len(frame)
+
+
+if __name__ == "__main__":
+    from results_store import upsert_csv
+    from strategies import STRATEGIES
+
+    parser = argparse.ArgumentParser(description="Windowed minute backtests and HDF5 table conversion.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run")
+    run.add_argument("symbols", nargs="+")
+    run.add_argument("--strategies", nargs="+", default=list(STRATEGIES))
+    run.add_argument("--workers", type=int, default=int(os.getenv("SWEEP_WORKERS", os.cpu_count())))
+    run.add_argument("--output", default="Performance_Metrics.csv")
+
+    table = commands.add_parser("table")
+    table.add_argument("symbols", nargs="*", help="symbols to convert (default: every minute .h5 file)")
+
+    args = parser.parse_args()
+    if args.command == "table":
+        symbols = args.symbols or sorted(name[:-3] for name in os.listdir(os.path.join("data", FREQUENCY_DIRS['m'])) if name.endswith(".h5"))
+        for symbol in symbols:
+            print(symbol, convert_to_table(symbol), "rows")
+    else:
+        rows = stream_minute_metrics(args.symbols, args.strategies, workers=args.workers)
+        upsert_csv(rows, args.output)
+        print(pd.DataFrame(rows).to_string(index=False))
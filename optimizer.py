@@ -0,0 +1,265 @@
+'''
+Declarative parameter search over the backtest grid. A JSON (or YAML, when PyYAML is installed) spec
+lists the universes, strategies (plain names or parametric families from strategies.py), holding
+periods and allocation % per frequency, and how to search them:
+
+    {
+        "universes": {"core": ["AAPL", "MSFT", "JPM"]},
+        "strategies": ["L_s_strategy", {"family": "surprise_threshold", "threshold_percentage": [2, 5, 10]}],
+        "frequencies": {
+            "d": {"holding_periods": {"start": 1, "stop": 31}, "allocation_percentage": [5, 10]},
+            "m": {"holding_periods": [1, 5, 10, 30], "allocation_percentage": [15]}
+        },
+        "search": {"method": "halving", "eta": 3, "symbol_fraction": 0.25, "years": [2022, 2023], "seed": 0},
+        "objective": "Sharpe Ratio",
+        "leaderboard": "Leaderboard.csv"
+    }
+
+Search methods:
+    "grid"     every configuration on the full universe and all years
+    "random"   "samples" configurations drawn from the grid, scored on the full universe
+    "halving"  successive halving: every (or "samples" drawn) configuration is scored on a seeded
+               symbol subsample and the "years" subset, only the best 1/eta survive to a subsample eta
+               times larger, and the last rung is the full universe over all years
+
+Configurations are scored with the sweep's work units, so each (frequency, allocation, symbol) is
+backtested once for all its strategies and horizons and reused across rungs. The result is a ranked
+leaderboard CSV: configurations that reached the last rung first, ordered by the objective.
+
+    python optimizer.py spec.json [--workers N]
+'''
+
+import argparse
+import itertools
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from earnings_tdata_json import analytics_row, holding_periods_for
+from event_engine import ALLOCATION_PERCENTAGE
+from results_store import write_atomic
+from strategies import STRATEGIES, register_family_member
+from sweep import _map, evaluate_unit, symbol_trading_logs
+
+SEARCH_METHODS = ("grid", "random", "halving")
+CONFIG_COLUMNS = ["Universe", "Strategy", "Holding Period", "Period Length", "Allocation (%)"]
+
+
+def load_spec(path):
+    with open(path) as file:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # PyYAML is only needed for YAML specs
+            return yaml.safe_load(file)
+        return json.load(file)
+
+
+def expand_values(values):
+    #A list, a scalar or an inclusive {"start", "stop", "step"} range
+    if isinstance(values, dict):
+        return list(range(values["start"], values["stop"] + 1, values.get("step", 1)))
+    return list(values) if isinstance(values, (list, tuple)) else [values]
+
+
+def expand_strategies(entries):
+    names = []
+    for entry in entries:
+        if isinstance(entry, str):
+            if entry not in STRATEGIES:
+                raise KeyError(f"Unknown strategy {entry}. Registered strategies: {', '.join(STRATEGIES)}")
+            names.append(entry)
+            continue
+        family = entry["family"]
+        parameters = {name: expand_values(values) for name, values in entry.items() if name != "family"}
+        for combination in itertools.product(*parameters.values()):
+            names.append(register_family_member(family, **dict(zip(parameters, combination))))
+    return list(dict.fromkeys(names))
+
+
+def expand_grid(spec):
+    '''
+    Every configuration of the spec as a dict keyed by CONFIG_COLUMNS, in spec order
+    (universe, frequency, allocation, strategy, holding period).
+    '''
+    strategies = expand_strategies(spec["strategies"])
+    frequencies = spec.get("frequencies", {frequency: {} for frequency in ("d", "m")})
+    configs = []
+    for universe in spec["universes"]:
+        for frequency, options in frequencies.items():
+            holding_periods = expand_values(options["holding_periods"]) if "holding_periods" in options else holding_periods_for(frequency)
+            allocations = expand_values(options.get("allocation_percentage", ALLOCATION_PERCENTAGE[frequency]))
+            for allocation in allocations:
+                for strat in strategies:
+                    for holding_period in holding_periods:
+                        configs.append({"Universe": universe, "Strategy": strat, "Holding Period": frequency,
+                                        "Period Length": holding_period, "Allocation (%)": allocation})
+    return configs
+
+
+def halving_rungs(symbol_fraction, eta):
+    #Symbol fractions per rung: symbol_fraction, *eta, ... until the full universe
+    rungs = max(1, math.ceil(math.log(1 / symbol_fraction, eta) - 1e-9) + 1) if symbol_fraction < 1 else 1
+    return [min(1.0, symbol_fraction * eta ** rung) for rung in range(rungs - 1)] + [1.0]
+
+
+def filter_years(trading_log, years):
+    if years is None:
+        return trading_log
+    return trading_log.in_years(years)
+
+
+class Optimizer:
+    '''
+    Scores configurations on (symbols, years) subsets. Trading logs are kept per
+    (frequency, allocation, symbol) for every strategy and horizon of the spec, so later rungs only
+    backtest the symbols they add.
+    '''
+
+    def __init__(self, spec, executor=None, workers=1):
+        self.spec = spec
+        self.executor = executor
+        self.workers = workers
+        self.strategies = expand_strategies(spec["strategies"])
+        self.logs = {}
+
+    def _holding_periods(self, frequency):
+        options = self.spec.get("frequencies", {}).get(frequency, {})
+        return expand_values(options["holding_periods"]) if "holding_periods" in options else holding_periods_for(frequency)
+
+    def _backtest(self, frequency, allocation, symbols):
+        missing = [symbol for symbol in symbols if (frequency, allocation, symbol) not in self.logs]
+        holding_periods = self._holding_periods(frequency)
+        symbol_logs = _map(self.executor, self.workers, symbol_trading_logs,
+                           [frequency] * len(missing), missing, [holding_periods] * len(missing),
+                           [self.strategies] * len(missing), [allocation] * len(missing))
+        for symbol, trading_logs in zip(missing, symbol_logs):
+            self.logs[(frequency, allocation, symbol)] = trading_logs
+
+    def score(self, configs, symbols_by_universe, years=None):
+        '''
+        Analytics row (plus the config's allocation and universe) for every config, in order, with
+        each universe restricted to symbols_by_universe[universe] and trades to the given years.
+        '''
+        groups = {}
+        for index, config in enumerate(configs):
+            key = (config["Universe"], config["Holding Period"], config["Allocation (%)"], config["Strategy"])
+            groups.setdefault(key, []).append(index)
+
+        for universe, frequency, allocation, _ in groups:
+            self._backtest(frequency, allocation, symbols_by_universe[universe])
+
+        units, empty = [], {}
+        for (universe, frequency, allocation, strat), indices in groups.items():
+            all_pnl_by_period = {}
+            for index in indices:
+                holding_period = configs[index]["Period Length"]
+                logs = [filter_years(self.logs[(frequency, allocation, symbol)][(strat, holding_period)], years)
+                        for symbol in symbols_by_universe[universe]]
+                if sum(len(log) for log in logs) == 0:
+                    empty[index] = analytics_row(strat, frequency, holding_period, *([np.nan] * 5)) # nothing traded in this subset
+                else:
+                    all_pnl_by_period[holding_period] = logs
+            if all_pnl_by_period:
+                units.append(((universe, frequency, allocation, strat), all_pnl_by_period))
+
+        results = _map(self.executor, self.workers, evaluate_unit, [unit[1] for unit in units],
+                       [unit[0][1] for unit in units], [unit[0][3] for unit in units])
+        scored = {}
+        for (group, _), strategy_rows in zip(units, results):
+            for analytics in strategy_rows:
+                scored[group + (analytics["Period Length"],)] = analytics
+
+        rows = []
+        for index, config in enumerate(configs):
+            analytics = empty.get(index) or scored[(config["Universe"], config["Holding Period"], config["Allocation (%)"],
+                                                    config["Strategy"], config["Period Length"])]
+            rows.append({**config, **analytics})
+        return rows
+
+
+def rank(rows, objective, minimize=False):
+    #Best first; NaN objectives (nothing traded) sink to the bottom
+    values = np.array([row[objective] for row in rows], dtype=np.float64)
+    values = np.where(np.isnan(values), np.inf, values if minimize else -values)
+    return list(np.argsort(values, kind="stable"))
+
+
+def run_search(spec, workers=None):
+    '''
+    Runs the spec's search and returns the leaderboard DataFrame, best configuration first, with the
+    rung each configuration was last scored on and the subset it was scored over.
+    '''
+    search = spec.get("search", {})
+    method = search.get("method", "halving")
+    if method not in SEARCH_METHODS:
+        raise ValueError(f"Unknown search method {method}. Methods: {', '.join(SEARCH_METHODS)}")
+    objective = spec.get("objective", "Sharpe Ratio")
+    minimize = spec.get("minimize", False)
+    eta = search.get("eta", 3)
+    rng = np.random.default_rng(search.get("seed", 0))
+
+    configs = expand_grid(spec)
+    samples = search.get("samples")
+    if method != "grid" and samples is not None and samples < len(configs):
+        configs = [configs[index] for index in sorted(rng.choice(len(configs), size=samples, replace=False))]
+
+    # One seeded permutation per universe; every rung takes a prefix of it, so subsamples are nested
+    universes = {name: list(symbols) for name, symbols in spec["universes"].items()}
+    permutations = {name: [symbols[index] for index in rng.permutation(len(symbols))] for name, symbols in universes.items()}
+
+    fractions = halving_rungs(search.get("symbol_fraction", 1 / eta ** 2), eta) if method == "halving" else [1.0]
+    workers = workers or os.cpu_count()
+    # Workers register the spec's parametric strategies themselves, whatever the process start method
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=expand_strategies, initargs=(spec["strategies"],)) if workers > 1 else None
+    leaderboard = {}
+    try:
+        optimizer = Optimizer(spec, executor, workers)
+        survivors = list(range(len(configs)))
+        for rung, fraction in enumerate(fractions):
+            last = rung == len(fractions) - 1
+            years = None if last else search.get("years")
+            symbols_by_universe = {name: symbols if fraction >= 1 else sorted(permutations[name][:max(1, math.ceil(fraction * len(symbols)))],
+                                                                               key=symbols.index)
+                                   for name, symbols in universes.items()}
+            rows = optimizer.score([configs[index] for index in survivors], symbols_by_universe, years)
+            for index, row in zip(survivors, rows):
+                leaderboard[index] = {**row, "Rung": rung, "Symbols": len(symbols_by_universe[row["Universe"]]),
+                                      "Years": "all" if years is None else " ".join(str(year) for year in years)}
+            if not last:
+                order = rank(rows, objective, minimize)
+                survivors = sorted(survivors[position] for position in order[:max(1, math.ceil(len(survivors) / eta))])
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    rows = [leaderboard[index] for index in range(len(configs))]
+    final_rung = len(fractions) - 1
+    ranked = []
+    for rung in range(final_rung, -1, -1): # deeper rungs were scored on more data, so they rank first
+        positions = [position for position, row in enumerate(rows) if row["Rung"] == rung]
+        ranked.extend(positions[offset] for offset in rank([rows[position] for position in positions], objective, minimize))
+
+    table = pd.DataFrame([rows[position] for position in ranked])
+    table.insert(0, "Rank", np.arange(1, len(table) + 1))
+    table["Finalist"] = table["Rung"] == final_rung
+    return table
+
+
+def write_leaderboard(table, filename):
+    write_atomic(filename, lambda temp_path: table.to_csv(temp_path, index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the backtest grid described by a spec and write a ranked leaderboard.")
+    parser.add_argument("spec", help="JSON or YAML search spec")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SWEEP_WORKERS", os.cpu_count())))
+    parser.add_argument("--output", help="leaderboard CSV (defaults to the spec's leaderboard or Leaderboard.csv)")
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    table = run_search(spec, workers=args.workers)
+    write_leaderboard(table, args.output or spec.get("leaderboard", "Leaderboard.csv"))
+    print(table.head(20).to_string(index=False))
@@ -0,0 +1,39 @@
+import os
+
+import pandas as pd
+
+from instrumentation import timed
+
+# Column names the rest of the backtester expects (matches the old API format)
+COLUMN_NAMES = {
+    "open": "1. open",
+    "close": "4. close",
+    "high": "2. high",
+    "low": "3. low"
+}
+
+FREQUENCY_DIRS = {
+    "m": "minute",
+    "d": "daily",
+}
+
+DEFAULT_START_DATE = "2019-01-01"
+
+
+@timed("load")
+def load_prices(symbol, frequency, start_date=DEFAULT_START_DATE, data_dir="data"):
+    #Read one symbol's bars and normalize them, preferring the columnar store when it has been built
+    from bar_store import has_bars, read_bars
+    columnar_root = os.path.join(data_dir, "columnar")
+    if has_bars(symbol, frequency, columnar_root):
+        return read_bars(symbol, frequency, start=start_date, root=columnar_root)
+
+    df = pd.read_hdf(os.path.join(data_dir, FREQUENCY_DIRS.get(frequency, "daily"), f"{symbol}.h5"))
+    df = df.rename(columns=COLUMN_NAMES)
+
+    df.index = pd.to_datetime(df.index)
+    df = df[df.index >= start_date]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind="stable")
+
+    return df
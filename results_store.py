@@ -0,0 +1,181 @@
+'''
+Incremental results store. Per-symbol trading logs are cached under results/trades/{frequency}/{SYMBOL}.pkl
+with a fingerprint of their inputs (price file mtime/size, earnings file hash, engine code version), and
+portfolio metrics are cached per (strategy, frequency, holding period) with a fingerprint of every symbol
+that fed them. A rerun only recomputes stale cells and rewrites Performance_Metrics.csv without duplicates.
+'''
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bar_store import TIMESTAMP_FILE, bar_dir
+from price_store import FREQUENCY_DIRS
+
+RESULTS_DIR = "results"
+METRICS_KEY = ["Strategy", "Holding Period", "Period Length"]
+
+# Bump when a change outside the modules in CODE_MODULES alters the trades produced for the same inputs
+CODE_VERSION = "1"
+# Everything between the input files and a trading log: event matching/filtering, earnings parsing,
+# price loading (start date cutoff, columnar reads), the engine itself and its trading-day rules.
+# Trade logs and, through the symbol fingerprints, the metrics built from them are invalidated when
+# any of these change
+CODE_MODULES = ["event_engine.py", "strategies.py", "trade_log.py", "earnings_tdata_json.py",
+                "earnings_calendar.py", "price_store.py", "bar_store.py", "trading_calendar.py"]
+# Modules that only turn trades into metrics rows; editing them invalidates cached metrics but not trades
+SCORING_MODULES = ["metrics.py", "market_benchmark.py"]
+BENCHMARK_FILE = "SnP.csv"
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_version(modules=CODE_MODULES):
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    digests = "".join(file_digest(os.path.join(module_dir, module)) for module in modules)
+    return f"{CODE_VERSION}:{hashlib.sha256(digests.encode()).hexdigest()[:16]}"
+
+
+def price_fingerprint(symbol, frequency, data_dir="data"):
+    #mtime + size is enough to notice a replaced price file without hashing gigabytes of minute bars
+    columnar = os.path.join(bar_dir(symbol, frequency, os.path.join(data_dir, "columnar")), TIMESTAMP_FILE)
+    path = columnar if os.path.exists(columnar) else os.path.join(data_dir, FREQUENCY_DIRS[frequency], f"{symbol}.h5")
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def earnings_fingerprint(symbol, data_dir="data"):
+    return file_digest(os.path.join(data_dir, "earnings", f"{symbol}_earnings.json"))
+
+
+def write_atomic(path, write):
+    #write(temp_path) produces the file, which then replaces path in one rename
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def file_manifest(paths):
+    #(path, mtime_ns, size) of every existing file, sorted: added, removed or replaced files all change it, whatever their mtimes
+    manifest = []
+    for path in sorted(paths):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            manifest.append((path, stat.st_mtime_ns, stat.st_size))
+    return manifest
+
+
+def manifest_arrays(manifest):
+    #Arrays to save next to a derived .npz so manifest_matches can tell whether it is still current
+    return {"source_paths": np.array([path for path, _, _ in manifest], dtype=str),
+            "source_mtimes": np.array([mtime for _, mtime, _ in manifest], dtype=np.int64),
+            "source_sizes": np.array([size for _, _, size in manifest], dtype=np.int64)}
+
+
+def manifest_matches(npz_path, manifest):
+    with np.load(npz_path, allow_pickle=False) as data:
+        if "source_paths" not in data.files:
+            return False
+        stored = list(zip(data["source_paths"].tolist(), data["source_mtimes"].tolist(), data["source_sizes"].tolist()))
+    return stored == manifest
+
+
+class ResultsStore:
+    def __init__(self, root=RESULTS_DIR, data_dir="data"):
+        self.root = root
+        self.data_dir = data_dir
+        self.code_version = code_version()
+        self.metrics_path = os.path.join(root, "metrics.pkl")
+        self._metrics = None
+
+    def fingerprint(self, symbol, frequency):
+        return (price_fingerprint(symbol, frequency, self.data_dir), earnings_fingerprint(symbol, self.data_dir), self.code_version)
+
+    def scoring_fingerprint(self):
+        #Inputs of the metrics beyond the trades: the scoring code and the S&P 500 file beta is computed against
+        benchmark = os.path.join(self.data_dir, BENCHMARK_FILE)
+        return (code_version(SCORING_MODULES), file_digest(benchmark) if os.path.exists(benchmark) else None)
+
+    def _trades_path(self, symbol, frequency):
+        return os.path.join(self.root, "trades", FREQUENCY_DIRS[frequency], f"{symbol}.pkl")
+
+    def cached_symbols(self, frequency):
+        directory = os.path.join(self.root, "trades", FREQUENCY_DIRS[frequency])
+        return sorted(name[:-len(".pkl")] for name in os.listdir(directory) if name.endswith(".pkl")) if os.path.isdir(directory) else []
+
+    def load_trades(self, symbol, frequency, fingerprint):
+        #Cached {(strat, holding_period): log} for the symbol, or {} when the inputs changed
+        path = self._trades_path(symbol, frequency)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'rb') as file:
+            cached = pickle.load(file)
+        return cached["logs"] if cached["fingerprint"] == fingerprint else {}
+
+    def save_trades(self, symbol, frequency, fingerprint, logs):
+        def write(temp_path):
+            with open(temp_path, 'wb') as file:
+                pickle.dump({"fingerprint": fingerprint, "logs": logs}, file, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(self._trades_path(symbol, frequency), write)
+
+    def _load_metrics(self):
+        if self._metrics is None:
+            self._metrics = {}
+            if os.path.exists(self.metrics_path):
+                with open(self.metrics_path, 'rb') as file:
+                    self._metrics = pickle.load(file)
+        return self._metrics
+
+    def cached_metrics(self, strat, frequency, holding_period, fingerprint):
+        cached = self._load_metrics().get((strat, frequency, holding_period))
+        if cached is not None and cached["fingerprint"] == fingerprint:
+            return cached["analytics"]
+        return None
+
+    def save_metrics(self, rows_by_key):
+        #rows_by_key: {(strat, frequency, holding_period): (fingerprint, analytics)}
+        metrics = self._load_metrics()
+        for key, (fingerprint, analytics) in rows_by_key.items():
+            metrics[key] = {"fingerprint": fingerprint, "analytics": analytics}
+
+        def write(temp_path):
+            with open(temp_path, 'wb') as file:
+                pickle.dump(metrics, file, protocol=pickle.HIGHEST_PROTOCOL)
+        write_atomic(self.metrics_path, write)
+
+
+def portfolio_fingerprint(symbol_fingerprints, scoring=()):
+    #Changes whenever any symbol's inputs change, the universe itself changes or the scoring inputs change
+    digest = hashlib.sha256(repr(tuple(scoring)).encode())
+    for symbol, fingerprint in sorted(symbol_fingerprints.items()):
+        digest.update(repr((symbol, fingerprint)).encode())
+    return digest.hexdigest()
+
+
+def upsert_csv(rows, filename, key=METRICS_KEY):
+    #Replace rows with the same key instead of appending duplicates, then swap the file in atomically
+    new_rows = pd.DataFrame(rows)
+    if os.path.exists(filename) and os.stat(filename).st_size > 0:
+        existing = pd.read_csv(filename)
+        merged = pd.concat([existing, new_rows], ignore_index=True)
+        merged = merged.drop_duplicates(subset=key, keep="last")
+    else:
+        merged = new_rows
+    write_atomic(filename, lambda temp_path: merged.to_csv(temp_path, index=False))
+    return merged
@@ -0,0 +1,181 @@
+'''
+Robustness engine for the per-date PnL of one run. Every portfolio (strategy, frequency, holding
+period) is reduced to its daily PnL series once; confidence intervals then come from resampling that
+series instead of rerunning the backtest:
+
+    bootstrap_metrics  circular moving-block bootstrap over dates. Each resample is an index array,
+                       so a chunk of resamples is one resamples x days gather, one cumsum for the
+                       portfolio values and one maximum.accumulate for the drawdown
+    walk_forward       year-by-year in-sample / out-of-sample splits: each test year is scored with the
+                       years before it (or the last train_years) as the in-sample period, and the
+                       portfolio with the best in-sample objective is flagged per split
+
+Portfolios are independent, so bootstraps are spread across a process pool, each with its own
+seed spawned from one SeedSequence so results do not depend on the worker count.
+
+    python robustness.py d --resamples 10000   (scores the trade logs cached in results/ by the sweep)
+'''
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metrics import INITIAL_INVESTMENT, TRADING_DAYS, stack_daily_pnl, stream_metrics
+
+BOOTSTRAP_METRICS = ["sharpe", "total_return", "max_drawdown"]
+RESAMPLE_CHUNK_BYTES = 64 * 1024 ** 2 # per-worker working set for one chunk of resampled paths
+
+
+def path_metrics(pnl_paths, initial_investment=INITIAL_INVESTMENT):
+    '''
+    Sharpe, total return and max drawdown of every row of a paths x days PnL matrix, with the
+    definitions stream_metrics uses (the first day has no return).
+    '''
+    values = initial_investment + np.cumsum(pnl_paths, axis=1)
+    daily_returns = values[:, 1:] / values[:, :-1] - 1
+    peaks = np.maximum.accumulate(values, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = daily_returns.mean(axis=1) * np.sqrt(TRADING_DAYS) / daily_returns.std(axis=1, ddof=1)
+    return {
+        "sharpe": sharpe,
+        "total_return": (values[:, -1] - initial_investment) / initial_investment,
+        "max_drawdown": ((values - peaks) / peaks).min(axis=1),
+    }
+
+
+def default_block_length(n_days):
+    #Cube-root rule for moving-block bootstraps
+    return max(1, int(round(n_days ** (1 / 3))))
+
+
+def block_indices(rng, n_days, block_length, resamples):
+    #resamples x n_days day indices made of circular blocks with uniform random starts
+    blocks = -(-n_days // block_length)
+    starts = rng.integers(0, n_days, size=(resamples, blocks))
+    indices = (starts[:, :, None] + np.arange(block_length)) % n_days
+    return indices.reshape(resamples, -1)[:, :n_days]
+
+
+def bootstrap_series(pnl, resamples, block_length, seed, initial_investment=INITIAL_INVESTMENT):
+    '''
+    Work unit for one portfolio: bootstrap distributions of BOOTSTRAP_METRICS from its daily PnL
+    (active days only), computed chunk by chunk to stay within RESAMPLE_CHUNK_BYTES.
+    '''
+    pnl = np.asarray(pnl, dtype=np.float64)
+    distributions = {name: np.full(resamples, np.nan) for name in BOOTSTRAP_METRICS}
+    if len(pnl) < 2:
+        return distributions
+    rng = np.random.default_rng(seed)
+    chunk = max(1, RESAMPLE_CHUNK_BYTES // (len(pnl) * 8 * 4)) # indices, gathered pnl, values and peaks
+    for start in range(0, resamples, chunk):
+        stop = min(resamples, start + chunk)
+        paths = pnl[block_indices(rng, len(pnl), block_length, stop - start)]
+        for name, values in path_metrics(paths, initial_investment).items():
+            distributions[name][start:stop] = values
+    return distributions
+
+
+def bootstrap_metrics(days, pnl_matrix, resamples=10000, block_length=None, seed=0, confidence=0.95, workers=None, labels=None):
+    '''
+    Block-bootstrap every portfolio of a portfolios x days PnL matrix (NaN = no trades that day, as
+    from stack_daily_pnl). Returns (summary DataFrame with the point estimate, bootstrap mean and
+    confidence bounds per metric, {metric: portfolios x resamples distributions}).
+    '''
+    pnl_matrix = np.atleast_2d(np.asarray(pnl_matrix, dtype=np.float64))
+    series = [row[~np.isnan(row)] for row in pnl_matrix]
+    block_lengths = [block_length or default_block_length(len(pnl)) for pnl in series]
+    seeds = np.random.SeedSequence(seed).spawn(len(series))
+
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(series) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(bootstrap_series, series, [resamples] * len(series), block_lengths, seeds,
+                                        chunksize=max(1, len(series) // (workers * 4))))
+    else:
+        results = [bootstrap_series(*unit) for unit in zip(series, [resamples] * len(series), block_lengths, seeds)]
+
+    distributions = {name: np.array([result[name] for result in results]).reshape(len(series), resamples) for name in BOOTSTRAP_METRICS}
+    point = stream_metrics(days, pnl_matrix)
+    tail = (1 - confidence) / 2 * 100
+    summary = pd.DataFrame({"Portfolio": labels if labels is not None else np.arange(len(series)),
+                            "Trading Days": [len(pnl) for pnl in series], "Block Length": block_lengths})
+    for name in BOOTSTRAP_METRICS:
+        with np.errstate(invalid="ignore"):
+            lower, upper = np.nanpercentile(distributions[name], [tail, 100 - tail], axis=1) if resamples else (np.nan, np.nan)
+        summary[name] = point[name]
+        summary[f"{name}_mean"] = np.nanmean(distributions[name], axis=1) if resamples else np.nan
+        summary[f"{name}_lower"] = lower
+        summary[f"{name}_upper"] = upper
+    return summary, distributions
+
+
+def walk_forward(days, pnl_matrix, train_years=None, objective="sharpe", labels=None):
+    '''
+    One row per (test year, portfolio) with in-sample and out-of-sample metrics. The in-sample period
+    is every earlier year, or only the last train_years. "Selected" marks the portfolio a walk-forward
+    selection by the in-sample objective would have traded in that test year.
+    '''
+    pnl_matrix = np.atleast_2d(np.asarray(pnl_matrix, dtype=np.float64))
+    years = pd.DatetimeIndex(days).year.values
+    labels = labels if labels is not None else np.arange(len(pnl_matrix))
+    frames = []
+    for test_year in np.unique(years)[1:]:
+        first_train_year = years.min() if train_years is None else test_year - train_years
+        in_sample = (years >= first_train_year) & (years < test_year)
+        out_of_sample = years == test_year
+        train = stream_metrics(days[in_sample], pnl_matrix[:, in_sample])
+        test = stream_metrics(days[out_of_sample], pnl_matrix[:, out_of_sample])
+
+        frame = pd.DataFrame({"Test Year": test_year, "Train Years": f"{first_train_year}-{test_year - 1}", "Portfolio": labels})
+        for name in BOOTSTRAP_METRICS:
+            frame[f"in_sample_{name}"] = train[name]
+            frame[f"out_of_sample_{name}"] = test[name]
+        scores = frame[f"in_sample_{objective}"].to_numpy(dtype=np.float64)
+        frame["Selected"] = False
+        if not np.all(np.isnan(scores)):
+            frame.loc[int(np.nanargmax(scores)), "Selected"] = True
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def portfolio_matrix(all_pnl_by_key):
+    '''
+    {key: [per-symbol trading logs]} (the sweep's all_pnl) -> (keys, days, portfolios x days PnL
+    matrix) ready for bootstrap_metrics / walk_forward.
+    '''
+    keys = list(all_pnl_by_key)
+    trade_dates = [np.concatenate([log.dates for log in all_pnl_by_key[key]]) for key in keys]
+    trade_pnls = [np.concatenate([log.pnl for log in all_pnl_by_key[key]]) for key in keys]
+    days, matrix = stack_daily_pnl(trade_dates, trade_pnls)
+    return keys, days, matrix
+
+
+if __name__ == "__main__":
+    from results_store import ResultsStore
+
+    parser = argparse.ArgumentParser(description="Bootstrap and walk-forward the trade logs cached by the sweep.")
+    parser.add_argument("holding_period_type", choices=["d", "m"])
+    parser.add_argument("--symbols", nargs="*", help="defaults to every symbol with cached trade logs")
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--block-length", type=int)
+    parser.add_argument("--train-years", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SWEEP_WORKERS", os.cpu_count())))
+    args = parser.parse_args()
+
+    store = ResultsStore()
+    symbols = args.symbols or store.cached_symbols(args.holding_period_type)
+    symbol_logs = [store.load_trades(symbol, args.holding_period_type, store.fingerprint(symbol, args.holding_period_type)) for symbol in symbols]
+    if not symbols or any(not logs for logs in symbol_logs):
+        raise SystemExit("Trade logs missing or stale: run the sweep with SWEEP_INCREMENTAL=1 first.")
+    keys = [key for key in symbol_logs[0] if all(key in logs for logs in symbol_logs)]
+    keys, days, matrix = portfolio_matrix({key: [logs[key] for logs in symbol_logs] for key in keys})
+    labels = [f"{strat} {args.holding_period_type}{holding_period}" for strat, holding_period in keys]
+
+    summary, _ = bootstrap_metrics(days, matrix, args.resamples, args.block_length, args.seed, workers=args.workers, labels=labels)
+    summary.to_csv("Bootstrap_Metrics.csv", index=False)
+    walk_forward(days, matrix, args.train_years, labels=labels).to_csv("Walk_Forward.csv", index=False)
+    print(summary.sort_values("sharpe_lower", ascending=False).head(20).to_string(index=False))
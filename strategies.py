@@ -0,0 +1,103 @@
+'''
+Strategy registry. A strategy is a vectorized rule over the event table: it receives every event of a
+symbol at once (beat flag, EPS surprise %, report time, ...) and returns a position direction per event
+(1 long, -1 short, 0 pass) and optionally a position weight (1.0 = the normal allocation).
+
+New strategies only need to be registered:
+
+    @register_strategy("L_big_beat_strategy")
+    def big_beat(events):
+        return np.where(events["surprisePercentage"] > 10, 1, 0), None
+'''
+
+import numpy as np
+import pandas as pd
+
+STRATEGIES = {}
+
+EVENT_COLUMNS = ["beat", "surprisePercentage", "reportedEPS", "estimatedEPS", "reportTime"]
+
+
+def register_strategy(name):
+    def decorator(rule):
+        STRATEGIES[name] = rule
+        return rule
+    return decorator
+
+
+def event_table(earnings_df):
+    #Plain arrays for the strategy rules; missing optional columns come through as NaN / empty strings
+    events = {}
+    for column in EVENT_COLUMNS:
+        if column in earnings_df.columns:
+            values = earnings_df[column]
+            events[column] = values.astype(str).to_numpy() if column == "reportTime" else values.to_numpy()
+        else:
+            events[column] = np.full(len(earnings_df), "" if column == "reportTime" else np.nan, dtype=object if column == "reportTime" else np.float64)
+    events["beat"] = np.asarray(pd.Series(events["beat"]).fillna(False), dtype=bool)
+    return events
+
+
+def strategy_positions(strat, events):
+    #(direction int8, weight float64) arrays for one registered strategy
+    if strat not in STRATEGIES:
+        raise KeyError(f"Unknown strategy {strat}. Registered strategies: {', '.join(STRATEGIES)}")
+    direction, weight = STRATEGIES[strat](events)
+    size = len(events["beat"])
+    direction = np.broadcast_to(np.asarray(direction, dtype=np.int8), size)
+    weight = np.ones(size) if weight is None else np.broadcast_to(np.asarray(weight, dtype=np.float64), size)
+    return direction, weight
+
+
+def strategy_matrix(strategies, events):
+    '''
+    Directions (int8) and weights (float64) of every strategy for every event as two strategies x
+    events matrices, built once per event table. Both engines size and sign their trades from these.
+    '''
+    size = len(events["beat"])
+    directions = np.empty((len(strategies), size), dtype=np.int8)
+    weights = np.empty((len(strategies), size))
+    for row, strat in enumerate(strategies):
+        directions[row], weights[row] = strategy_positions(strat, events)
+    return directions, weights
+
+
+def sign_on_beat(on_beat, on_miss):
+    def rule(events):
+        return np.where(events["beat"], on_beat, on_miss), None
+    return rule
+
+
+register_strategy("L_s_strategy")(sign_on_beat(1, -1))   #long if beat, short if miss
+register_strategy("L_if_strategy")(sign_on_beat(1, 0))   #long if beat, pass if miss
+register_strategy("L_strategy")(sign_on_beat(1, 1))      #Long every announcement
+register_strategy("S_if_strategy")(sign_on_beat(0, -1))  #Short if miss, pass if beat
+register_strategy("S_strategy")(sign_on_beat(-1, -1))    #Short every announcement
+
+
+def surprise_threshold(threshold_percentage):
+    #Long when the EPS surprise beats +threshold%, short below -threshold%, pass in between
+    def rule(events):
+        surprise = np.asarray(events["surprisePercentage"], dtype=np.float64)
+        return np.where(surprise > threshold_percentage, 1, np.where(surprise < -threshold_percentage, -1, 0)), None
+    return rule
+
+
+register_strategy("L_s_surprise_5_strategy")(surprise_threshold(5))
+
+
+# Parametric families the optimizer can sweep: family -> (rule factory, name template for one parameter set)
+STRATEGY_FAMILIES = {
+    "surprise_threshold": (surprise_threshold, "L_s_surprise_{threshold_percentage:g}_strategy"),
+}
+
+
+def register_family_member(family, **parameters):
+    #Registers one parameter set of a family under its templated name and returns the name
+    if family not in STRATEGY_FAMILIES:
+        raise KeyError(f"Unknown strategy family {family}. Families: {', '.join(STRATEGY_FAMILIES)}")
+    factory, template = STRATEGY_FAMILIES[family]
+    name = template.format(**parameters)
+    if name not in STRATEGIES:
+        register_strategy(name)(factory(**parameters))
+    return name
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from earnings_calendar import load_calendar
+from earnings_tdata_json import append_to_csv, evaluate_portfolios, holding_periods_for, return_on_earning_multi
+from event_engine import DayIndex
+from price_store import load_prices
+from results_store import portfolio_fingerprint, upsert_csv
+
+
+def symbol_trading_logs(holding_period_type, symbol, holding_periods, strategies, allocation_percentage=None):
+    '''
+    Work unit for one (frequency, symbol): builds the trading logs of every strategy and holding period.
+    Prices are loaded inside the worker, so no frames are pickled to it, and dropped when it returns.
+    '''
+    prices_df = load_prices(symbol, holding_period_type)
+    day_index = DayIndex(prices_df.index)
+    return return_on_earning_multi(symbol, prices_df, holding_period_type, holding_periods, strategies, day_index, allocation_percentage)
+
+
+def evaluate_unit(all_pnl_by_period, holding_period_type, strat):
+    #Work unit for one (frequency, strategy): every pending holding period scored in one batched pass
+    return evaluate_portfolios(all_pnl_by_period, holding_period_type, strat)
+
+
+def _map(executor, workers, function, *iterables):
+    # executor.map keeps results in submission order, which keeps the merge deterministic
+    if executor is None:
+        return map(function, *iterables)
+    units = len(iterables[0])
+    chunksize = max(1, units // (workers * 4)) # a few chunks per worker to balance load
+    return executor.map(function, *iterables, chunksize=chunksize)
+
+
+def stale_units(store, holding_period_type, symbols, holding_periods, strategies):
+    '''
+    Loads each symbol's cached logs and works out what still has to be computed. Returns the symbol
+    fingerprints, the cached logs and one (symbol, holding_periods, strategies) unit per stale symbol.
+    '''
+    wanted = {(strat, holding_period) for strat in strategies for holding_period in holding_periods}
+    fingerprints, cached, units = {}, {}, []
+    for symbol in symbols:
+        fingerprints[symbol] = store.fingerprint(symbol, holding_period_type)
+        cached[symbol] = store.load_trades(symbol, holding_period_type, fingerprints[symbol])
+        missing = wanted - set(cached[symbol])
+        if missing:
+            units.append((symbol,
+                          sorted({holding_period for _, holding_period in missing}),
+                          [strat for strat in strategies if any(key[0] == strat for key in missing)]))
+    return fingerprints, cached, units
+
+
+def run_sweep(symbols, strategies, holding_types=('d', 'm'), workers=None, filename="Performance_Metrics.csv", store=None):
+    '''
+    Runs the full (frequency, strategy, holding period, symbol) grid across a process pool and
+    appends one Performance_Metrics row per (strategy, frequency, holding period) in grid order.
+    workers=1 runs everything in-process. Returns the rows as a DataFrame.
+
+    With a ResultsStore, only symbols whose inputs changed (or that lack some strategy/horizon) are
+    recomputed, portfolios whose symbols are all unchanged reuse their cached metrics, and the CSV is
+    rewritten with one row per configuration instead of appended to.
+    '''
+    workers = workers or os.cpu_count()
+    load_calendar() # re-ingested here if stale, so workers only read it
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    rows = []
+    try:
+        for holding_period_type in holding_types:
+            holding_periods = holding_periods_for(holding_period_type)
+            keys = [(strat, holding_period) for strat in strategies for holding_period in holding_periods]
+
+            # Stage 1: one unit per symbol, every strategy and horizon from a single pass over its prices
+            if store is None:
+                units = [(symbol, holding_periods, strategies) for symbol in symbols]
+                cached = {symbol: {} for symbol in symbols}
+            else:
+                fingerprints, cached, units = stale_units(store, holding_period_type, symbols, holding_periods, strategies)
+
+            symbol_logs = _map(executor, workers, symbol_trading_logs,
+                               [holding_period_type] * len(units), [unit[0] for unit in units],
+                               [unit[1] for unit in units], [unit[2] for unit in units])
+            for (symbol, _, _), trading_logs in zip(units, symbol_logs):
+                cached[symbol].update(trading_logs)
+                if store is not None:
+                    store.save_trades(symbol, holding_period_type, fingerprints[symbol], cached[symbol])
+
+            all_pnl = {key: [cached[symbol][key] for symbol in symbols] for key in keys}
+
+            # Stage 2: one unit per strategy, scoring all of its holding periods together
+            analytics_by_key = {}
+            if store is not None:
+                portfolio = portfolio_fingerprint(fingerprints, store.scoring_fingerprint())
+                for strat, holding_period in keys:
+                    analytics = store.cached_metrics(strat, holding_period_type, holding_period, portfolio)
+                    if analytics is not None:
+                        analytics_by_key[(strat, holding_period)] = analytics
+            pending = [key for key in keys if key not in analytics_by_key]
+
+            pending_strategies = [strat for strat in strategies if any(key[0] == strat for key in pending)]
+            results = _map(executor, workers, evaluate_unit,
+                           [{holding_period: all_pnl[(strat, holding_period)] for s, holding_period in pending if s == strat} for strat in pending_strategies],
+                           [holding_period_type] * len(pending_strategies), pending_strategies)
+            for strategy_rows in results:
+                for analytics in strategy_rows:
+                    analytics_by_key[(analytics["Strategy"], analytics["Period Length"])] = analytics
+            if store is None:
+                for key in keys:
+                    append_to_csv(pd.DataFrame([analytics_by_key[key]]), filename) # one locked write per row
+
+            if store is not None:
+                store.save_metrics({(strat, holding_period_type, holding_period): (portfolio, analytics_by_key[(strat, holding_period)])
+                                    for strat, holding_period in pending})
+            rows.extend(analytics_by_key[key] for key in keys)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if store is not None:
+        upsert_csv(rows, filename)
+    return pd.DataFrame(rows)
@@ -0,0 +1,142 @@
+'''
+Typed columnar trading log. Each column is one NumPy array: the symbol as an int32 code into a small
+category table, the execution date as datetime64[ns], the position as an int8 sign and prices, shares,
+amount invested and PnL as float64. Logs concatenate by stacking arrays (remapping symbol codes),
+and reductions read the PnL/date columns directly, so nothing is parsed back from strings.
+
+Formatting only happens at export: to_frame(formatted=True) gives the original layout with "$12.34"
+Open/Close strings, to_csv writes it, and to_arrow / to_parquet write typed columns (the symbol
+dictionary-encoded) for downstream tools. pyarrow is only needed for those two.
+'''
+
+import numpy as np
+import pandas as pd
+
+POSITION_NAMES = {1: "long", -1: "short"}
+
+TRADING_LOG_COLUMNS = ["dateExecuted", "Position", "Stock", "Open", "Close", "Amount Invested", "Change (%)", "PnL"]
+
+FLOAT_FIELDS = ["open_prices", "close_prices", "shares", "amount_invested", "pnl"]
+
+
+class TradeLog:
+    __slots__ = ("symbols", "symbol_codes", "dates", "signs") + tuple(FLOAT_FIELDS)
+
+    def __init__(self, symbols, symbol_codes, dates, signs, open_prices, close_prices, shares, amount_invested, pnl):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.symbol_codes = np.asarray(symbol_codes, dtype=np.int32)
+        self.dates = np.asarray(dates, dtype="datetime64[ns]")
+        self.signs = np.asarray(signs, dtype=np.int8)
+        self.open_prices = np.asarray(open_prices, dtype=np.float64)
+        self.close_prices = np.asarray(close_prices, dtype=np.float64)
+        self.shares = np.asarray(shares, dtype=np.float64)
+        self.amount_invested = np.asarray(amount_invested, dtype=np.float64)
+        self.pnl = np.asarray(pnl, dtype=np.float64)
+
+    @classmethod
+    def from_arrays(cls, symbol, dates, open_prices, close_prices, signs, shares, amount_invested, pnl):
+        #One symbol's trades: every row gets symbol code 0
+        return cls([symbol], np.zeros(len(dates), dtype=np.int32), dates, signs, open_prices, close_prices,
+                   shares, amount_invested, pnl)
+
+    @classmethod
+    def empty(cls):
+        return cls([], *([np.empty(0)] * 8))
+
+    @classmethod
+    def concat(cls, logs):
+        #Stack logs in order; symbol categories are merged and codes remapped onto the merged table
+        logs = list(logs)
+        if not logs:
+            return cls.empty()
+        remapped = []
+        positions = {}
+        for log in logs:
+            mapping = np.array([positions.setdefault(symbol, len(positions)) for symbol in log.symbols], dtype=np.int32)
+            remapped.append(mapping[log.symbol_codes] if len(mapping) else log.symbol_codes)
+        return cls(list(positions), np.concatenate(remapped), np.concatenate([log.dates for log in logs]),
+                   np.concatenate([log.signs for log in logs]),
+                   *[np.concatenate([getattr(log, field) for log in logs]) for field in FLOAT_FIELDS])
+
+    @classmethod
+    def from_frame(cls, df):
+        #Back from an exported frame/CSV; "$" price strings and "long"/"short" positions are parsed once here
+        stocks = pd.Categorical(df["Stock"])
+        prices = [pd.to_numeric(df[column].astype(str).str.lstrip("$"), errors="coerce").to_numpy(dtype=np.float64) for column in ("Open", "Close")]
+        amount_invested = pd.to_numeric(df["Amount Invested"], errors="coerce").to_numpy(dtype=np.float64)
+        pnl = pd.to_numeric(df["PnL"], errors="coerce").to_numpy(dtype=np.float64)
+        # Later holding days carry no Amount Invested, so their shares are recovered from the PnL
+        # (approximate when the prices were exported as rounded "$" strings)
+        moved = np.abs(prices[1] - prices[0])
+        shares = np.where(amount_invested > 0, amount_invested / prices[0], np.abs(pnl) / np.where(moved > 0, moved, np.inf))
+        return cls(list(stocks.categories), stocks.codes, pd.to_datetime(df["dateExecuted"]).to_numpy(dtype="datetime64[ns]"),
+                   np.where(df["Position"].to_numpy() == POSITION_NAMES[-1], -1, 1), prices[0], prices[1], np.round(shares),
+                   amount_invested, pnl)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, field).nbytes for field in self.__slots__ if field != "symbols")
+
+    @property
+    def change_percentage(self):
+        return (self.close_prices - self.open_prices) / self.open_prices * 100
+
+    @property
+    def stocks(self):
+        return pd.Categorical.from_codes(self.symbol_codes, categories=pd.Index(self.symbols, dtype=object)) if len(self.symbols) else pd.Categorical([])
+
+    def select(self, rows):
+        #Rows by boolean mask or index array, keeping the category table
+        return TradeLog(self.symbols, self.symbol_codes[rows], self.dates[rows], self.signs[rows],
+                        *[getattr(self, field)[rows] for field in FLOAT_FIELDS])
+
+    def sort_by_date(self):
+        return self.select(np.argsort(self.dates, kind="stable"))
+
+    def in_years(self, years):
+        return self.select(np.isin(self.dates.astype("datetime64[Y]").astype(np.int64) + 1970, list(years)))
+
+    def to_frame(self, formatted=False):
+        '''
+        The TRADING_LOG_COLUMNS layout. Prices stay float64 unless formatted=True, which renders
+        Open/Close as "$12.34" strings the way the trading logs used to be built.
+        '''
+        if formatted:
+            open_column = np.char.mod("$%.2f", self.open_prices) if len(self) else np.empty(0, dtype=str)
+            close_column = np.char.mod("$%.2f", self.close_prices) if len(self) else np.empty(0, dtype=str)
+        else:
+            open_column, close_column = self.open_prices, self.close_prices
+        return pd.DataFrame({
+            "dateExecuted": pd.DatetimeIndex(self.dates),
+            "Position": np.where(self.signs > 0, POSITION_NAMES[1], POSITION_NAMES[-1]),
+            "Stock": self.stocks,
+            "Open": open_column,
+            "Close": close_column,
+            "Amount Invested": self.amount_invested,
+            "Change (%)": self.change_percentage,
+            "PnL": self.pnl,
+        }, columns=TRADING_LOG_COLUMNS)
+
+    def to_csv(self, path, formatted=True):
+        self.to_frame(formatted).to_csv(path, index=False)
+
+    def to_arrow(self):
+        import pyarrow as pa # optional, only for Arrow/Parquet export
+        return pa.table({
+            "dateExecuted": pa.array(self.dates),
+            "Position": pa.array(self.signs),
+            "Stock": pa.DictionaryArray.from_arrays(pa.array(self.symbol_codes), pa.array(list(self.symbols), type=pa.string())),
+            "Open": pa.array(self.open_prices),
+            "Close": pa.array(self.close_prices),
+            "Shares": pa.array(self.shares),
+            "Amount Invested": pa.array(self.amount_invested),
+            "Change (%)": pa.array(self.change_percentage),
+            "PnL": pa.array(self.pnl),
+        })
+
+    def to_parquet(self, path):
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
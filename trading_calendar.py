@@ -0,0 +1,178 @@
+'''
+Shared trading calendar: the union of the days with bars in every price file under data/ whose
+timestamps can be read on their own (the columnar copy or a table-format .h5; fixed-format files are
+skipped rather than decoded whole), weekdays only, minus an optional exchange holiday list in
+data/holidays.csv (one date per line), saved as data/trading_calendar.npz. A dense day-ordinal table
+maps any date to the first trading day on/after it, so "the n-th trading day on/after each date" is
+one gather for a whole array of dates. The file is rebuilt when a price file or the holiday list is
+added, removed or changed, and each process loads it once. It only sizes reads, so days missing
+from it cost a wider search, never a different trade.
+
+    python trading_calendar.py     (rebuild data/trading_calendar.npz)
+'''
+
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from bar_store import TIMESTAMP_FILE, bar_dir, has_bars
+from price_store import FREQUENCY_DIRS
+from results_store import file_manifest, manifest_arrays, manifest_matches, write_atomic
+
+DATA_DIR = "data"
+CALENDAR_FILE = "trading_calendar.npz"
+HOLIDAYS_FILE = "holidays.csv"
+
+_loaded = {}
+
+
+def day_values(dates):
+    #datetime64[D] days of dates (NaT stays NaT)
+    return pd.DatetimeIndex(np.atleast_1d(np.asarray(dates, dtype="datetime64[ns]"))).normalize().values.astype("datetime64[D]")
+
+
+def is_weekday(ordinals):
+    #Monday to Friday for day ordinals; 1970-01-01 was a Thursday, so (ordinal + 3) % 7 is the weekday with Monday=0
+    return (np.asarray(ordinals) + 3) % 7 <= 4
+
+
+def trading_rank(is_trading):
+    '''
+    Trading days before each slot along the first axis of is_trading, with one extra slot for the
+    end: the first trading day on/after slot d is the rank[d]-th one (rank[d] == total when there is
+    none) and the k-th after it is rank[d] + k.
+    '''
+    is_trading = np.asarray(is_trading, dtype=bool)
+    rank = np.zeros((len(is_trading) + 1,) + is_trading.shape[1:], dtype=np.int64)
+    np.cumsum(is_trading, axis=0, out=rank[1:])
+    return rank
+
+
+def next_trading_table(ordinals, base, span):
+    #rank over the dense day range base .. base + span - 1, where the given day ordinals are the trading days
+    marks = np.zeros(span, dtype=bool)
+    marks[ordinals - base] = True
+    return trading_rank(marks)
+
+
+class TradingCalendar:
+    def __init__(self, days):
+        self.days = np.unique(np.asarray(days, dtype="datetime64[D]"))
+        ordinals = self.days.astype(np.int64)
+        self.base = ordinals[0] if len(ordinals) else 0
+        span = (ordinals[-1] - self.base + 1) if len(ordinals) else 0
+
+        # next_trading[d] = position in days of the first trading day on/after day d (len(days) past the end)
+        self.next_trading = next_trading_table(ordinals, self.base, span)
+
+    @classmethod
+    def from_index(cls, index, holidays=()):
+        #Calendar of one price index: weekdays with bars, minus holidays
+        days = np.unique(day_values(index))
+        days = days[is_weekday(days.astype(np.int64))]
+        return cls(np.setdiff1d(days, day_values(holidays)) if len(holidays) else days)
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.days.nbytes + self.next_trading.nbytes
+
+    def positions(self, dates):
+        #Position in days of the first trading day on/after each date (len(days) when past the calendar)
+        offsets = day_values(dates).astype(np.int64) - self.base
+        return self.next_trading[np.clip(offsets, 0, len(self.next_trading) - 1)]
+
+    def nth_trading_day(self, dates, n=0):
+        '''
+        The n-th trading day on/after each date (n=0 is the first), as datetime64[ns]; n broadcasts
+        against dates. NaT where the calendar ends first or the date is NaT.
+        '''
+        dates = np.atleast_1d(np.asarray(dates, dtype="datetime64[ns]"))
+        positions = self.positions(dates) + np.asarray(n, dtype=np.int64)
+        valid = (positions >= 0) & (positions < len(self.days)) & ~np.isnat(dates)
+        found = self.days[np.clip(positions, 0, max(len(self.days) - 1, 0))] if len(self.days) else np.full(positions.shape, np.datetime64("NaT", "D"))
+        return np.where(valid, found, np.datetime64("NaT", "D")).astype("datetime64[ns]")
+
+    def is_trading_day(self, dates):
+        return np.isin(day_values(dates), self.days)
+
+
+def read_holidays(path):
+    if not os.path.exists(path):
+        return np.empty(0, dtype="datetime64[D]")
+    with open(path, 'r') as file:
+        lines = [line.split("#")[0].strip() for line in file]
+    return day_values(pd.to_datetime([line for line in lines if line], errors="coerce").dropna())
+
+
+def price_sources(data_dir=DATA_DIR):
+    #(symbol, frequency, path) of every price file, the columnar copy when it has been built
+    sources = []
+    for frequency, directory in FREQUENCY_DIRS.items():
+        for file_path in sorted(glob.glob(os.path.join(data_dir, directory, "*.h5"))):
+            symbol = os.path.basename(file_path)[:-3]
+            columnar_root = os.path.join(data_dir, "columnar")
+            if has_bars(symbol, frequency, columnar_root):
+                file_path = os.path.join(bar_dir(symbol, frequency, columnar_root), TIMESTAMP_FILE)
+            sources.append((symbol, frequency, file_path))
+    return sources
+
+
+def file_days(path):
+    #Distinct days of one price file from its timestamps alone; none for fixed-format .h5, which would need a full decode
+    if path.endswith(".npy"):
+        return np.unique(np.load(path, mmap_mode="r") // 86_400_000_000_000).astype("datetime64[D]")
+    with pd.HDFStore(path, mode="r") as store:
+        key = store.keys()[0]
+        if not store.get_storer(key).is_table:
+            return np.empty(0, dtype="datetime64[D]")
+        index = store.select_column(key, "index")
+    return np.unique(day_values(pd.to_datetime(index)))
+
+
+def build(data_dir=DATA_DIR, path=None):
+    #Union the days of every price file, drop weekends and holidays, and write the calendar atomically
+    path = path or os.path.join(data_dir, CALENDAR_FILE)
+    sources = price_sources(data_dir)
+    manifest = calendar_manifest(data_dir, sources)
+    days = np.unique(np.concatenate([file_days(file_path) for _, _, file_path in sources])) if sources else np.empty(0, dtype="datetime64[D]")
+    holidays = read_holidays(os.path.join(data_dir, HOLIDAYS_FILE))
+    calendar = TradingCalendar.from_index(days, holidays)
+
+    def write(temp_path):
+        with open(temp_path, 'wb') as file:
+            np.savez(file, days=calendar.days, holidays=holidays, **manifest_arrays(manifest))
+    write_atomic(path, write)
+    return path
+
+
+def calendar_manifest(data_dir=DATA_DIR, sources=None):
+    sources = price_sources(data_dir) if sources is None else sources
+    return file_manifest([file_path for _, _, file_path in sources] + [os.path.join(data_dir, HOLIDAYS_FILE)])
+
+
+def is_stale(data_dir=DATA_DIR, path=None):
+    #Stale unless the calendar was built from exactly the current price files and holiday list
+    path = path or os.path.join(data_dir, CALENDAR_FILE)
+    return not os.path.exists(path) or not manifest_matches(path, calendar_manifest(data_dir))
+
+
+def load_calendar(data_dir=DATA_DIR, path=None):
+    #Loaded once per process; rebuilt first if the price files or the holiday list changed since it was built
+    path = path or os.path.join(data_dir, CALENDAR_FILE)
+    if path not in _loaded:
+        if is_stale(data_dir, path):
+            build(data_dir, path)
+        with np.load(path, allow_pickle=False) as data:
+            _loaded[path] = TradingCalendar(data["days"])
+    return _loaded[path]
+
+
+if __name__ == "__main__":
+    calendar = TradingCalendar(np.load(build())["days"])
+    print(f"Wrote {os.path.join(DATA_DIR, CALENDAR_FILE)} with {len(calendar)} trading days"
+          + (f" ({calendar.days[0]} to {calendar.days[-1]})" if len(calendar) else ""))
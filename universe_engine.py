@@ -0,0 +1,215 @@
+'''
+Cross-sectional daily engine for whole universes. Instead of one trading log per symbol that is later
+concatenated, sorted and grouped, a chunk of symbols is aligned into one dates x symbols OHLC panel
+and every earnings event is placed on it:
+
+    rank[d, s]          trading days of symbol s before panel row d, so the first trading day on/after
+                        any date is one lookup and the k-th holding day is rank + k
+    trading_rows[i, s]  panel row of the i-th trading day of symbol s
+
+Each trade's PnL is then scattered into a (holding day k) x dates matrix with one bincount per
+strategy. Holding periods are nested (a 5-day hold is the first 5 days of a 31-day hold), so a
+cumulative sum over k turns it into the horizons x dates portfolio PnL matrix the metrics engine
+scores. Symbols are processed in chunks whose panel fits budget_bytes; only the small per-chunk
+PnL/count matrices are kept and merged onto the union of dates at the end.
+
+Same trades and metrics as the per-symbol daily engine (float sums may differ in the last bits).
+'''
+
+import os
+
+import numpy as np
+
+from earnings_calendar import symbol_events
+from earnings_tdata_json import holding_periods_for, score_pnl_matrix
+from event_engine import ALLOCATION_PERCENTAGE, entry_dates, event_arrays, position_sizes
+from instrumentation import count, stage
+from price_store import load_prices
+from strategies import event_table, strategy_matrix
+from trading_calendar import is_weekday, trading_rank
+
+PANEL_BUDGET_BYTES = int(os.getenv("PANEL_BUDGET_BYTES", 512 * 1024 ** 2))
+PANEL_BYTES_PER_CELL = 8 * 4 + 2 # open, close, rank and trading_rows, plus two masks
+
+
+class UniversePanel:
+    '''
+    Daily open/close for a list of symbols on the union of their days (NaN where a symbol has no
+    bar), with per-symbol trading-day tables for event resolution.
+    '''
+
+    def __init__(self, symbols, frames):
+        self.symbols = list(symbols)
+        day_values = [frame.index.normalize().values.astype("datetime64[ns]") for frame in frames]
+        self.days = np.unique(np.concatenate(day_values)) if day_values else np.empty(0, dtype="datetime64[ns]")
+        shape = (len(self.days), len(self.symbols))
+        self.open = np.full(shape, np.nan)
+        self.close = np.full(shape, np.nan)
+        self.has_bar = np.zeros(shape, dtype=bool)
+        for column, (frame, days) in enumerate(zip(frames, day_values)):
+            unique_days, first_rows = np.unique(days, return_index=True) # first bar of a day, as DayIndex does
+            rows = np.searchsorted(self.days, unique_days)
+            self.open[rows, column] = frame["1. open"].to_numpy(dtype=np.float64)[first_rows]
+            self.close[rows, column] = frame["4. close"].to_numpy(dtype=np.float64)[first_rows]
+            self.has_bar[rows, column] = True
+
+        is_trading = self.has_bar & is_weekday(self.days.astype("datetime64[D]").astype(np.int64))[:, None]
+        self.n_trading = is_trading.sum(axis=0)
+        self.rank = trading_rank(is_trading)
+        self.trading_rows = np.argsort(~is_trading, axis=0, kind="stable")
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.days, self.open, self.close, self.has_bar, self.rank, self.trading_rows))
+
+    def resolve(self, columns, reported, post_market, holding_period):
+        '''
+        Panel rows traded by each event (symbol column, report date, post-market flag): an
+        events x holding_period matrix, -1 where the report date has no bar or the data runs out.
+        '''
+        report_rows = np.searchsorted(self.days, reported)
+        found = report_rows < len(self.days)
+        report_rows = np.minimum(report_rows, len(self.days) - 1)
+        listed = found & (self.days[report_rows] == reported) & self.has_bar[report_rows, columns]
+
+        entry_rows = np.searchsorted(self.days, entry_dates(reported, post_market))
+        positions = self.rank[entry_rows, columns][:, None] + np.arange(holding_period)[None, :]
+        valid = listed[:, None] & (positions < self.n_trading[columns][:, None])
+        rows = self.trading_rows[np.where(valid, positions, 0), columns[:, None]]
+        return np.where(valid, rows, -1)
+
+
+def universe_events(symbols):
+    #Every symbol's events stacked, with the symbol's panel column per event
+    frames = [symbol_events(symbol) for symbol in symbols]
+    tables = [event_table(frame) for frame in frames]
+    arrays = [event_arrays(frame) for frame in frames]
+    columns = np.concatenate([np.full(len(frame), column, dtype=np.int64) for column, frame in enumerate(frames)])
+    events = {name: np.concatenate([table[name] for table in tables]) for name in tables[0]}
+    reported = np.concatenate([reported for reported, _ in arrays])
+    post_market = np.concatenate([post_market for _, post_market in arrays])
+    return columns, reported, post_market, events
+
+
+def panel_pnl(panel, strategies, holding_periods, allocation_percentage):
+    '''
+    {strat: (horizons x days PnL, horizons x days trade counts)} for one panel. Every trade lands in
+    the (holding day, date) cell of a flat bincount; a cumulative sum over holding days gives each
+    holding period's matrix.
+    '''
+    longest = max(holding_periods)
+    with stage("event_matching"):
+        columns, reported, post_market, events = universe_events(panel.symbols)
+        rows = panel.resolve(columns, reported, post_market, longest)
+    count("events", len(columns))
+
+    with stage("trade_generation"):
+        valid = rows >= 0
+        safe_rows = np.where(valid, rows, 0)
+        open_matrix = panel.open[safe_rows, columns[:, None]]
+        close_matrix = panel.close[safe_rows, columns[:, None]]
+        cells = (np.arange(longest)[None, :] * len(panel.days) + safe_rows)[valid]
+        size = longest * len(panel.days)
+        selected = np.asarray(holding_periods) - 1
+
+        directions, weights = strategy_matrix(strategies, events)
+        base_shares = position_sizes(open_matrix, allocation_percentage)
+        results = {}
+        for strat, direction, weight in zip(strategies, directions, weights):
+            shares = base_shares if np.all(weight == 1) else position_sizes(open_matrix, allocation_percentage, weights=weight[:, None])
+            pnl = (shares * (close_matrix - open_matrix) * direction[:, None])[valid]
+            traded = np.broadcast_to(direction[:, None] != 0, valid.shape)[valid]
+            with stage("aggregation"):
+                by_day = np.bincount(cells[traded], weights=pnl[traded], minlength=size).reshape(longest, -1)
+                counts = np.bincount(cells[traded], minlength=size).reshape(longest, -1)
+                results[strat] = (np.cumsum(by_day, axis=0)[selected], np.cumsum(counts, axis=0)[selected])
+            count("trades", results[strat][1].sum())
+    return results
+
+
+def symbol_chunks(symbols, budget_bytes=PANEL_BUDGET_BYTES, loader=load_prices):
+    '''
+    Loads symbols in order and yields (symbols, frames) chunks whose panel stays within
+    budget_bytes (at least one symbol per chunk).
+    '''
+    chunk_symbols, chunk_frames, rows = [], [], 0
+    for symbol in symbols:
+        frame = loader(symbol, 'd')
+        # The panel is (union of days) x symbols, so size it by the longest history in the chunk
+        longest = max(rows, len(frame))
+        if chunk_symbols and longest * (len(chunk_symbols) + 1) * PANEL_BYTES_PER_CELL > budget_bytes:
+            yield chunk_symbols, chunk_frames
+            chunk_symbols, chunk_frames, longest = [], [], len(frame)
+        chunk_symbols.append(symbol)
+        chunk_frames.append(frame)
+        rows = longest
+    if chunk_symbols:
+        yield chunk_symbols, chunk_frames
+
+
+def merge_chunks(chunk_results, strategies):
+    #Add every chunk's matrices onto the union of their dates
+    days = np.unique(np.concatenate([chunk_days for chunk_days, _ in chunk_results]))
+    merged = {}
+    for strat in strategies:
+        pnl = counts = None
+        for chunk_days, results in chunk_results:
+            chunk_pnl, chunk_counts = results[strat]
+            if pnl is None:
+                pnl = np.zeros((len(chunk_pnl), len(days)))
+                counts = np.zeros((len(chunk_counts), len(days)), dtype=np.int64)
+            positions = np.searchsorted(days, chunk_days)
+            pnl[:, positions] += chunk_pnl
+            counts[:, positions] += chunk_counts
+        merged[strat] = (pnl, counts)
+    return days, merged
+
+
+def universe_daily_pnl(symbols, strategies, holding_periods, allocation_percentage=None, budget_bytes=PANEL_BUDGET_BYTES, loader=load_prices):
+    '''
+    Whole-universe daily backtest: returns (days, {strat: (horizons x days PnL, horizons x days
+    trade counts)}), built chunk by chunk within budget_bytes.
+    '''
+    allocation_percentage = allocation_percentage or ALLOCATION_PERCENTAGE["d"]
+    chunk_results = []
+    for chunk_symbols, frames in symbol_chunks(symbols, budget_bytes, loader):
+        panel = UniversePanel(chunk_symbols, frames)
+        del frames
+        chunk_results.append((panel.days, panel_pnl(panel, strategies, holding_periods, allocation_percentage)))
+        del panel
+    return merge_chunks(chunk_results, strategies)
+
+
+def universe_metrics(symbols, strategies, holding_periods=None, allocation_percentage=None, budget_bytes=PANEL_BUDGET_BYTES, loader=load_prices):
+    '''
+    Performance_Metrics rows for every (strategy, holding period) of a daily universe backtest, in
+    the same order and layout the sweep produces.
+    '''
+    holding_periods = list(holding_periods or holding_periods_for('d'))
+    days, results = universe_daily_pnl(symbols, strategies, holding_periods, allocation_percentage, budget_bytes, loader)
+    rows = []
+    for strat in strategies:
+        pnl, counts = results[strat]
+        pnl_matrix = np.where(counts > 0, pnl, np.nan)
+        rows.extend(score_pnl_matrix(days, pnl_matrix, counts.sum(axis=1), 'd', strat, holding_periods))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import pandas as pd
+
+    from results_store import upsert_csv
+    from strategies import STRATEGIES
+
+    parser = argparse.ArgumentParser(description="Daily whole-universe backtest on a dates x symbols panel.")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES))
+    parser.add_argument("--budget-bytes", type=int, default=PANEL_BUDGET_BYTES)
+    parser.add_argument("--output", default="Performance_Metrics.csv")
+    args = parser.parse_args()
+
+    rows = universe_metrics(args.symbols, args.strategies, budget_bytes=args.budget_bytes)
+    upsert_csv(rows, args.output)
+    print(pd.DataFrame(rows).to_string(index=False))